@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Benchmarks.
+
+Times the translation stages on samples.txt and on generated corpora of
+several sizes, and the import time. Results can be saved as JSON, and
+compared against a saved baseline.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import haags
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import haags
+t1 = time.perf_counter()
+haags.warmup()
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1)
+"""
+
+SIZES = [1000, 10000, 100000]
+
+# Results that are slower than the baseline by more than this fraction
+# are reported as regressions.
+REGRESSION_THRESHOLD = 0.10
+
+
+def bench_import(repeat: int) -> Dict[str, float]:
+    """Measure import and warmup time in fresh interpreters."""
+    import_times: List[float] = []
+    warmup_times: List[float] = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+        import_time, warmup_time = map(float, output.split())
+        import_times.append(import_time)
+        warmup_times.append(warmup_time)
+    return {
+        "import": statistics.median(import_times),
+        "warmup": statistics.median(warmup_times),
+    }
+
+
+#
+# Corpora
+#
+
+
+def sample_lines() -> List[str]:
+    with open("samples.txt", encoding="utf-8") as fp:
+        lines = fp.read().splitlines()
+    return [line.split("/")[0] for line in lines if line and not line.startswith("#")]
+
+
+def sample_words() -> List[str]:
+    words: Set[str] = set()
+    for line in sample_lines():
+        words.update(t.value for t in haags.tokenize(line) if t.type == "word")
+    return sorted(words)
+
+
+def fill(size: int, parts: Callable[[], str]) -> str:
+    out: List[str] = []
+    length = 0
+    while length < size:
+        part = parts()
+        out.append(part)
+        length += len(part)
+    return "".join(out)[:size]
+
+
+def corpus_samples(size: int, rng: random.Random) -> str:
+    lines = sample_lines()
+    return fill(size, lambda: rng.choice(lines) + "\n")
+
+
+def corpus_prose(size: int, rng: random.Random) -> str:
+    words = sample_words()
+
+    def sentence() -> str:
+        n = rng.randint(4, 16)
+        s = " ".join(rng.choice(words) for _ in range(n))
+        return s[:1].upper() + s[1:] + rng.choice([". ", ". ", "? ", "! ", ".\n"])
+
+    return fill(size, sentence)
+
+
+def corpus_contractions(size: int, rng: random.Random) -> str:
+    contractions = sorted(haags.ALL_CONTRACTIONS)
+    words = sample_words()
+
+    def part() -> str:
+        s = rng.choice(contractions)
+        if rng.random() < 0.3:
+            s = s.capitalize()
+        return s + rng.choice([" ", " ", ", ", "? "]) + rng.choice(words) + " "
+
+    return fill(size, part)
+
+
+def corpus_compounds(size: int, rng: random.Random) -> str:
+    words = [word.lower() for word in sample_words() if len(word) > 2]
+
+    def compound() -> str:
+        return "".join(rng.choice(words) for _ in range(rng.randint(3, 6))) + " "
+
+    return fill(size, compound)
+
+
+def corpus_junk(size: int, rng: random.Random) -> str:
+    words = sample_words()
+
+    def junk() -> str:
+        return rng.choice(
+            [
+                "https://example.com/{}?q={}&page={} ".format(
+                    rng.choice(words), rng.randint(0, 999), rng.randint(0, 9)
+                ),
+                "{}@example.nl ".format(rng.choice(words).lower()),
+                "{},{} ".format(rng.randint(0, 9999), rng.randint(0, 99)),
+                "😀🎉 ",
+                "<b>{}</b> ".format(rng.choice(words)),
+                "#{} ".format(rng.choice(words)),
+                rng.choice(words) + " ",
+            ]
+        )
+
+    return fill(size, junk)
+
+
+CORPORA: Dict[str, Callable[[int, random.Random], str]] = {
+    "samples": corpus_samples,
+    "prose": corpus_prose,
+    "contractions": corpus_contractions,
+    "compounds": corpus_compounds,
+    "junk": corpus_junk,
+}
+
+
+def generate(name: str, size: int, seed: int = 0) -> str:
+    """Generate a corpus; the same arguments give the same text."""
+    return CORPORA[name](size, random.Random(seed))
+
+
+#
+# Stages
+#
+
+
+def measure(fn: Callable[[], Any], repeat: int, setup: Callable[[], Any]) -> float:
+    """Return the median wall time of `repeat` calls to `fn`."""
+    times = []
+    for _ in range(repeat):
+        setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def bench_stages(text: str, repeat: int) -> Dict[str, float]:
+    """Time each stage on `text`; inputs for each stage are prepared first."""
+    tokens = list(haags.tokenize(text))
+    words = [token.value.lower() for token in tokens if token.type == "word"]
+    syllables = [syl for word in words for syl in haags.split_into_syllables(word)]
+    translator = haags.default_translator
+
+    def clear_caches() -> None:
+        haags.word_cache.clear()
+        haags.result_cache.clear()
+
+    def nothing() -> None:
+        pass
+
+    def translate_syllables() -> None:
+        for syl in syllables:
+            translator.translate_syllable(syl)
+
+    benchmarks: Dict[str, Callable[[], Any]] = {
+        "tokenize": lambda: list(haags.tokenize(text)),
+        "apply_contractions": lambda: haags.apply_contractions(tokens),
+        "split_into_syllables": lambda: [
+            haags.split_into_syllables(word) for word in words
+        ],
+        "translate_syllable": translate_syllables,
+        "apply_single_words": lambda: haags.apply_single_words(tokens),
+        "translate": lambda: haags.translate(text),
+        "translate_cold": lambda: haags.translate(text),
+    }
+    haags.translate(text)  # warm up
+    return {
+        stage: measure(
+            fn, repeat, clear_caches if stage == "translate_cold" else nothing
+        )
+        for stage, fn in benchmarks.items()
+    }
+
+
+def run(
+    corpora: List[str], sizes: List[int], repeat: int, import_repeat: int
+) -> Dict[str, Any]:
+    haags.warmup()
+    results: Dict[str, Dict[str, float]] = {}
+    for name in corpora:
+        for size in sizes:
+            text = generate(name, size)
+            for stage, seconds in bench_stages(text, repeat).items():
+                results["{}/{}/{}".format(stage, name, size)] = {
+                    "seconds": seconds,
+                    "chars_per_second": size / seconds if seconds else 0.0,
+                }
+    if import_repeat:
+        for name, seconds in bench_import(import_repeat).items():
+            results[name] = {"seconds": seconds}
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "results": results,
+    }
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """Print a comparison with `baseline`; return the regressed benchmarks."""
+    regressions = []
+    print()
+    print("{:<45} {:>12} {:>12} {:>8}".format("", "baseline", "now", "change"))
+    for key, result in report["results"].items():
+        previous = baseline["results"].get(key)
+        if previous is None or not previous["seconds"]:
+            continue
+        change = result["seconds"] / previous["seconds"] - 1
+        marker = ""
+        if change > threshold:
+            marker = "  slower"
+            regressions.append(key)
+        elif change < -threshold:
+            marker = "  faster"
+        print(
+            "{:<45} {:>9.3f} ms {:>9.3f} ms {:>+7.1%}{}".format(
+                key,
+                previous["seconds"] * 1000,
+                result["seconds"] * 1000,
+                change,
+                marker,
+            )
+        )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--import-repeat",
+        type=int,
+        default=5,
+        help="import time measurements (0 to skip)",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        choices=sorted(CORPORA),
+        help="corpus to use; may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--size",
+        action="append",
+        type=int,
+        help="corpus size in characters; may be repeated (default: {})".format(
+            ", ".join(map(str, SIZES))
+        ),
+    )
+    parser.add_argument("--output", metavar="PATH", help="write results as JSON")
+    parser.add_argument(
+        "--baseline", metavar="PATH", help="compare with results saved earlier"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="fraction by which a benchmark may be slower than the baseline",
+    )
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.corpus or list(CORPORA),
+        args.size or SIZES,
+        args.repeat,
+        args.import_repeat,
+    )
+    for key, result in report["results"].items():
+        print("{:<45} {:10.3f} ms".format(key, result["seconds"] * 1000))
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+            fp.write("\n")
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
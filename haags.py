@@ -1,13 +1,44 @@
 #!/usr/bin/env python
 
+import array
+import atexit
+import bisect
 import collections
+import contextlib
+import contextvars
+import functools
+import hashlib
 import itertools
+import json
+import mmap
+import os
 import re
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+import types
 import typing
-from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, TypeVar
+import warnings
+import zlib
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
 
 import attr
-import pyphen
+
+if typing.TYPE_CHECKING:
+    import concurrent.futures
+    import sqlite3
 
 T = TypeVar("T")
 
@@ -27,6 +58,8 @@ def undo_case_hack(s: str) -> str:
 
 
 def detect_case(s: str) -> str:
+    if s.isascii() and s.islower():
+        return "lower"  # fast path for the most common case
     s = apply_case_hack(s)
     if not s:
         case = "other"
@@ -45,6 +78,8 @@ def detect_case(s: str) -> str:
 
 def recase(s: str, case: str) -> str:
     """Change letter case of a string."""
+    if case == "lower" and s.islower() and "ĳ" not in s:
+        return s  # fast path; avoids a copy
     s = apply_case_hack(s)
     if case == "lower":
         s = s.lower()
@@ -63,15 +98,15 @@ def recase(s: str, case: str) -> str:
 #
 
 # Matches runs of whitespace.
-WHITESPACE_RE = re.compile(r"(\s+)")
+WHITESPACE_PATTERN = r"\s+"
 
 # Matches numbers, optionally with separator dots and commas. May not
 # have a word character directly after it (e.g. does not match "123abc").
-NUMBER_RE = re.compile(r"(\d+(?:[,.]\d+)*)(?!\w\s)")
+NUMBER_PATTERN = r"\d+(?:[,.]\d+)*(?!\w\s)"
 
 # Matches "words", including the shorthands "'n", "'r" , and "'t".
 # Matches may include digits and underscores.
-WORD_RE = re.compile(r"([\w-]+|'[nrt])\b")
+WORD_PATTERN = r"(?:[\w-]+|'[nrt])\b"
 
 # Matches punctuation characters that may occur in normal text.
 PUNCTUATION_CHARS = "".join(
@@ -82,7 +117,27 @@ PUNCTUATION_CHARS = "".join(
         "&/",  # misc
     ]
 )
-PUNCTUATION_RE = re.compile(r"([{}]+)".format(re.escape(PUNCTUATION_CHARS)))
+PUNCTUATION_PATTERN = r"[{}]+".format(re.escape(PUNCTUATION_CHARS))
+
+# Combined scanner. The alternatives are tried in order at each
+# position. Anything else is unknown input, which is consumed as a
+# single run up to the next position where a known token starts.
+KNOWN_TOKEN_PATTERNS = [  # This is an ordered list.
+    ("whitespace", WHITESPACE_PATTERN),
+    ("number", NUMBER_PATTERN),
+    ("word", WORD_PATTERN),
+    ("punctuation", PUNCTUATION_PATTERN),
+]
+KNOWN_TOKEN_PATTERN = "|".join(pattern for _, pattern in KNOWN_TOKEN_PATTERNS)
+TOKEN_RE = re.compile(
+    "|".join(
+        [
+            *("(?P<{}>{})".format(type, p) for type, p in KNOWN_TOKEN_PATTERNS),
+            r"(?P<other>(?:(?!{}).)+)".format(KNOWN_TOKEN_PATTERN),
+        ]
+    ),
+    re.DOTALL,
+)
 
 
 def is_regular_word(s: str) -> bool:
@@ -91,61 +146,142 @@ def is_regular_word(s: str) -> bool:
     return s.isalpha()
 
 
+# Token types, and the codes used for them in token streams. The order
+# of the first five matches the groups in TOKEN_RE.
+TOKEN_TYPES = ["whitespace", "number", "word", "punctuation", "other", "translated"]
+TOKEN_TYPE_CODES = {type: code for code, type in enumerate(TOKEN_TYPES)}
+WHITESPACE = TOKEN_TYPE_CODES["whitespace"]
+WORD = TOKEN_TYPE_CODES["word"]
+PUNCTUATION = TOKEN_TYPE_CODES["punctuation"]
+OTHER = TOKEN_TYPE_CODES["other"]
+
+
 @attr.s(init=False, slots=True)
 class Token:
-    TYPES = {
-        "word",
-        "whitespace",
-        "punctuation",
-        "number",
-        "other",
-        "translated",
-    }
+    TYPES = set(TOKEN_TYPES)
 
     value = attr.ib()
     type = attr.ib()
-    case = attr.ib(repr=False)
-    value_lower = attr.ib(repr=False)
 
     def __init__(self, value: str, type: str) -> None:
         self.value = value
-        self.value_lower = value.lower()
         assert type in self.TYPES
         self.type = type
-        self.case = detect_case(value) if self.type == "word" else None
 
+    @property
+    def value_lower(self) -> str:
+        return self.value.lower()
+
+    @property
+    def case(self) -> Optional[str]:
+        return detect_case(self.value) if self.type == "word" else None
 
-WHITESPACE_TOKEN = Token(" ", "whitespace")
+
+# Type code for text offsets. 32 bits take half the memory of 64 bits,
+# and suffice for texts shorter than 4G characters.
+OFFSET_TYPECODE = "I" if array.array("I").itemsize >= 4 else "L"
+
+
+@attr.s(slots=True, frozen=True, eq=False)
+class TokenStream:
+    """
+    Compact representation of a tokenised text.
+
+    Tokens are stored as type codes and offsets into the text, without
+    creating any objects or strings per token. Token `i` spans
+    ``text[bounds[i]:bounds[i + 1]]``.
+    """
+
+    text: str = attr.ib()
+    types: "array.array[int]" = attr.ib()
+    bounds: "array.array[int]" = attr.ib()
+
+    @classmethod
+    def from_text(cls, s: str) -> "TokenStream":
+        types = array.array("B")
+        bounds = array.array(OFFSET_TYPECODE if len(s) < 2**32 else "q")
+        add_type = types.append
+        add_bound = bounds.append
+        for m in TOKEN_RE.finditer(s):
+            code = (m.lastindex or 0) - 1
+            start = m.start()
+            if code == WORD and not is_regular_word(s[start : m.end()]):
+                code = OTHER
+            add_type(code)
+            add_bound(start)
+        bounds.append(len(s))
+        return cls(s, types, bounds)
+
+    @classmethod
+    def from_tokens(cls, tokens: Iterable[Token]) -> "TokenStream":
+        values = []
+        types = array.array("B")
+        for token in tokens:
+            values.append(token.value)
+            types.append(TOKEN_TYPE_CODES[token.type])
+        text = "".join(values)
+        bounds = array.array(OFFSET_TYPECODE if len(text) < 2**32 else "q", [0])
+        bounds.extend(itertools.accumulate(map(len, values)))
+        return cls(text, types, bounds)
+
+    def extended(self, s: str) -> "TokenStream":
+        """
+        Tokenise the text with `s` appended, reusing the tokens before it.
+
+        The last tokens can still change when more text follows, since
+        the patterns look ahead a few characters, so these are scanned
+        again.
+        """
+        keep = max(0, len(self.types) - 2)
+        offset = self.bounds[keep]
+        text = self.text + s
+        tail = TokenStream.from_text(text[offset:])
+        types = self.types[:keep]
+        types.extend(tail.types)
+        bounds = array.array(OFFSET_TYPECODE if len(text) < 2**32 else "q")
+        bounds.extend(self.bounds[:keep])
+        bounds.extend(offset + bound for bound in tail.bounds)
+        return TokenStream(text, types, bounds)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def value(self, i: int) -> str:
+        return self.text[self.bounds[i] : self.bounds[i + 1]]
+
+    def lower(self, i: int) -> str:
+        return self.text[self.bounds[i] : self.bounds[i + 1]].lower()
+
+    def type(self, i: int) -> str:
+        return TOKEN_TYPES[self.types[i]]
+
+    def tokens(self) -> Iterator[Token]:
+        """Create Token instances for all tokens."""
+        for i in range(len(self.types)):
+            yield Token(self.value(i), TOKEN_TYPES[self.types[i]])
+
+
+def as_token_stream(tokens: typing.Union[TokenStream, Iterable[Token]]) -> TokenStream:
+    if isinstance(tokens, TokenStream):
+        return tokens
+    return TokenStream.from_tokens(tokens)
 
 
 def tokenize(s: str) -> Iterator[Token]:
-    regexes_with_token_types = [  # This is an ordered list.
-        (WHITESPACE_RE, "whitespace"),
-        (NUMBER_RE, "number"),
-        (WORD_RE, "word"),
-        (PUNCTUATION_RE, "punctuation"),
-    ]
+    return TokenStream.from_text(s).tokens()
+
+
+SENTENCE_TERMINATORS = ".?!"
 
-    junk = ""  # Accumulates unknown input.
-    pos = 0
-    while pos < len(s):
-        for regex, token_type in regexes_with_token_types:
-            m = regex.match(s, pos)
-            if m is None:
-                continue
-            if junk:  # Emit pending junk, if any.
-                yield Token(junk, type="other")
-                junk = ""
-            value = m.group()
-            assert value
-            if token_type == "word" and not is_regular_word(value):
-                token_type = "other"
-            yield Token(value, type=token_type)
-            pos = m.end()
-            break
-        else:
-            junk += s[pos]
-            pos += 1  # FIXME
+
+def is_sentence_boundary(stream: TokenStream, pos: int) -> bool:
+    """Check whether the whitespace token at `pos` ends a sentence."""
+    value = stream.value(pos)
+    if "\n" in value:
+        return True
+    return stream.types[pos - 1] == PUNCTUATION and any(
+        c in SENTENCE_TERMINATORS for c in stream.value(pos - 1)
+    )
 
 
 #
@@ -203,84 +339,41 @@ ALL_CONTRACTIONS = {
     "zal ik": "zallik",
     "zeg het": "zeggut",
 }
-ALL_CONTRACTIONS_BY_SIZE: typing.DefaultDict[
-    int, Dict[str, str]
-] = collections.defaultdict(dict)
-for dutch, haags in ALL_CONTRACTIONS.items():
-    key = len(dutch.split())
-    ALL_CONTRACTIONS_BY_SIZE[key][dutch] = haags
 
 
-def words_from_tokens(tokens: Sequence[Token], offset: int, n: int) -> str:
+@attr.s(slots=True)
+class ContractionNode:
     """
-    Obtain `n` words from `tokens` as a single string, starting at `offset`.
+    Node in a trie of contractions, keyed on lowercased words.
     """
-    g = (t.value_lower for t in tokens[offset:] if t.type == "word")
-    return " ".join(itertools.islice(g, n))
 
+    children: Dict[str, "ContractionNode"] = attr.ib(factory=dict)
+    replacement: Optional[str] = attr.ib(default=None)
 
-def make_token_type_string(
-    tokens: Sequence[Token], pad_with_spaces: bool = True
-) -> str:
-    # Make a string with one character per token, which indicates the
-    # token type. "Hallo, wereld!" becomes "w, w," (word, punctuation,
-    # space, ...).
-    mapping = {
-        "word": "w",
-        "whitespace": " ",
-        "punctuation": ",",
-        "number": "1",
-        "other": "_",
-        "translated": "t",
-    }
-    s = "".join(mapping[t.type] for t in tokens)
-    return s
 
+def build_contraction_trie(contractions: typing.Mapping[str, str]) -> ContractionNode:
+    root = ContractionNode()
+    for dutch, haags in contractions.items():
+        node = root
+        for word in dutch.split():
+            node = node.children.setdefault(word, ContractionNode())
+        node.replacement = haags
+    return root
 
-def apply_contractions(tokens: Sequence[Token]) -> List[Token]:
-    # Contractions are found by looking for patterns in the list of
-    # tokens, and comparing these against lookup tables. For example,
-    # "word space word space word" is a candidate a 3 word contraction.
-    # To make this easier, transform the list of token into a simple
-    # string containing the token types, so that regular expressions can
-    # be used for matching.
-
-    tokens = list(tokens)
-
-    # Add whitespace tokens at the beginning and end for easier
-    # matching. This means there is no special casing for matching at
-    # the start of the end of the token stream.
-    tokens = [WHITESPACE_TOKEN] + tokens + [WHITESPACE_TOKEN]
-
-    # Search for long matches first, e.g. 4 words, then 3 words, and so on.
-    items = sorted(ALL_CONTRACTIONS_BY_SIZE.items(), reverse=True)
-
-    for size, contractions in items:
-        # Look for space separated words (e.g. "w w w)", followed by
-        # either whitespace or punctuation+whitespace.
-        types_str = make_token_type_string(tokens)
-        base_pattern = " ".join(["w"] * size)
-        pattern = re.compile(r"{}(?= |, )".format(base_pattern))
-        pos = 0
-        while True:
-            m = pattern.search(types_str, pos)
-            if m is None:
-                break
-            pos = m.start() + 1
-            lookup = words_from_tokens(tokens, m.start(), size)
-            replacement = contractions.get(lookup)
-            if not replacement:
-                continue
-            replacement = recase(replacement, tokens[m.start()].case)
-            tokens[m.start() : m.end()] = [Token(replacement, "translated")]
-            types_str = make_token_type_string(tokens)  # refresh
 
-    # Remove whitespace wrapping.
-    assert tokens[0] == WHITESPACE_TOKEN
-    assert tokens[-1] == WHITESPACE_TOKEN
-    tokens = tokens[1:-1]
+def is_contraction_end(types: Sequence[int], pos: int) -> bool:
+    """
+    Check whether a contraction may end right before `pos`.
 
-    return tokens
+    A contraction must be followed by either whitespace or
+    punctuation+whitespace. The end of the token stream counts as
+    whitespace.
+    """
+    if pos >= len(types) or types[pos] == WHITESPACE:
+        return True
+    if types[pos] == PUNCTUATION:
+        return pos + 1 >= len(types) or types[pos + 1] == WHITESPACE
+    return False
 
 
 #
@@ -324,37 +417,71 @@ VOWELS = sorted(
 )
 CONSONANTS = "bcçdfghjklmnpqrstvwxz"
 
+# Finds the vowels in a syllable in a single scan. At each position, the
+# alternatives are tried in VOWELS order, so the match is the preferred
+# vowel starting there.
+NUCLEUS_RE = re.compile(
+    "(?=({}))".format("|".join(re.escape(vowel) for vowel in VOWELS))
+)
+
+# Position of each vowel in VOWELS; the first one counts for duplicates.
+VOWEL_RANKS = {vowel: rank for rank, vowel in reversed(list(enumerate(VOWELS)))}
+
+
+def find_nucleus(value: str) -> Optional[Tuple[int, int]]:
+    """
+    Find the nucleus of a syllable.
+
+    This is the first vowel from VOWELS (longest first) that occurs in
+    `value`, at its first occurrence.
+    """
+    best = None
+    best_rank = len(VOWELS)
+    for m in NUCLEUS_RE.finditer(value):
+        rank = VOWEL_RANKS[m.group(1)]
+        if rank < best_rank:
+            best = m
+            best_rank = rank
+    if best is None:
+        return None
+    return best.span(1)
+
 
 @attr.s(init=False, slots=True)
 class Syllable:
     """
     Container for a single syllable and its context.
 
+    The syllable is a view on the word it is part of, which avoids
+    copying the rest of the word for every syllable.
+
     See:
     - https://nl.wikipedia.org/wiki/Lettergreep
     - https://en.wikipedia.org/wiki/Syllable
     """
 
-    value = attr.ib()
+    value: str = attr.ib()
 
     # Subdivision of the syllable, and derived properties.
-    onset = attr.ib()
-    rime = attr.ib()
-    nucleus = attr.ib()
-    coda = attr.ib()
-    open = attr.ib()
-
-    # Context: all letters before and after this syllable, and the
-    # syllables preceding and following this one.
-    head = attr.ib()
-    tail = attr.ib()
-    previous = attr.ib(default=None, repr=False, hash=False)
-    next = attr.ib(default=None, repr=False, hash=False)
-
-    def __init__(self, value: str, *, head: str, tail: str) -> None:
-        self.value = value
-        self.head = head
-        self.tail = tail
+    onset: str = attr.ib()
+    rime: str = attr.ib()
+    nucleus: str = attr.ib()
+    coda: str = attr.ib()
+    open: bool = attr.ib()
+
+    # Context: the word, the position of this syllable within it, and
+    # the syllables preceding and following this one.
+    word: str = attr.ib(repr=False)
+    start: int = attr.ib()
+    stop: int = attr.ib()
+    previous: Optional["Syllable"] = attr.ib(default=None, repr=False, hash=False)
+    next: Optional["Syllable"] = attr.ib(default=None, repr=False, hash=False)
+
+    def __init__(self, word: str, start: int, stop: int) -> None:
+        self.word = word
+        self.start = start
+        self.stop = stop
+        self.value = value = word[start:stop]
         self.previous = None
         self.next = None
 
@@ -363,11 +490,12 @@ class Syllable:
         # nucleus, optionally preceded by an onset, and optionally
         # followed by a coda.
         # https://en.wikipedia.org/wiki/Syllable#Components
-        for vowel in VOWELS:
-            if vowel not in value:
-                continue
-            self.onset, self.nucleus, self.coda = value.partition(vowel)
-            break
+        span = find_nucleus(value)
+        if span is not None:
+            vowel_start, vowel_stop = span
+            self.onset = value[:vowel_start]
+            self.nucleus = value[vowel_start:vowel_stop]
+            self.coda = value[vowel_stop:]
         else:
             # This is not a normal syllable. TODO: do something more
             # sensible than this for cases that occur in normal text.
@@ -376,6 +504,16 @@ class Syllable:
         self.rime = self.nucleus + self.coda
         self.open = False if self.coda else True
 
+    @property
+    def head(self) -> str:
+        """All letters before this syllable."""
+        return self.word[: self.start]
+
+    @property
+    def tail(self) -> str:
+        """All letters after this syllable."""
+        return self.word[self.stop :]
+
 
 SYLLABLES = {
     "aan": "an",
@@ -384,276 +522,536 @@ SYLLABLES = {
 }
 
 
-def translate_syllable(syl: Syllable) -> Tuple[str, int]:
-    translated = SYLLABLES.get(syl.value)
-    if translated is not None:
-        return translated, 1
+@attr.s(slots=True)
+class SyllableParts:
+    """The parts of a syllable translation that rules can change."""
 
-    # defaults serving as the starting point
-    onset = syl.onset
-    nucleus = syl.nucleus
-    coda = syl.coda
+    onset: str = attr.ib()
+    nucleus: str = attr.ib()
+    coda: str = attr.ib()
+
+
+# A rule body looks at a syllable (and its context) and either changes
+# the parts of the translation, or returns the final translation and
+# the number of syllables it covers.
+RuleFunction = typing.Callable[[Syllable, SyllableParts], Optional[Tuple[str, int]]]
 
-    #
-    # special cases
-    #
 
-    # jus
-    if syl.value == "jus":
-        if syl.tail.startswith("t"):
-            # e.g. justitie (justisie)
-            return "jus", 1
+@attr.s(frozen=True, slots=True)
+class SyllableRule:
+    """
+    A syllable translation rule.
+
+    The conditions only look at the letters of the syllable itself:
+    rules only apply to syllables with one of the listed values, nuclei,
+    rimes, onsets or codas (if any), and for which `match` (if any)
+    returns True. The rule function checks the context, if needed.
+    """
+
+    name: str = attr.ib()
+    function: RuleFunction = attr.ib(repr=False)
+    order: int = attr.ib(repr=False)
+    values: typing.FrozenSet[str] = attr.ib(default=frozenset())
+    nuclei: typing.FrozenSet[str] = attr.ib(default=frozenset())
+    rimes: typing.FrozenSet[str] = attr.ib(default=frozenset())
+    onsets: typing.FrozenSet[str] = attr.ib(default=frozenset())
+    codas: typing.FrozenSet[str] = attr.ib(default=frozenset())
+    match: Optional[typing.Callable[[Syllable], bool]] = attr.ib(
+        default=None, repr=False
+    )
+
+    def matches(self, syl: Syllable) -> bool:
+        return (
+            (not self.values or syl.value in self.values)
+            and (not self.nuclei or syl.nucleus in self.nuclei)
+            and (not self.rimes or syl.rime in self.rimes)
+            and (not self.onsets or syl.onset in self.onsets)
+            and (not self.codas or syl.coda in self.codas)
+            and (self.match is None or self.match(syl))
+        )
+
+
+class SyllableRuleSet:
+    """
+    Ordered collection of syllable rules.
+
+    Rules are indexed on the letters they apply to. The rules that can
+    apply to a syllable only depend on its letters, so they are looked
+    up once per distinct syllable, and then only those rules run.
+    """
+
+    # Maximum number of distinct syllables to remember rules for.
+    max_dispatch_size = 65536
+
+    def __init__(self) -> None:
+        self.rules: List[SyllableRule] = []
+        self.indexes: Dict[str, Dict[str, List[SyllableRule]]] = {
+            "values": {},
+            "nuclei": {},
+            "rimes": {},
+            "onsets": {},
+            "codas": {},
+        }
+        self.unindexed: List[SyllableRule] = []
+        self.dispatch: Dict[str, Tuple[SyllableRule, ...]] = {}
+
+    def __reduce_ex__(self, protocol: typing.SupportsIndex) -> Any:
+        # The rules contain lambdas, so the default rule set is pickled
+        # by name, e.g. when sending a Translator to a worker process.
+        if self is SYLLABLE_RULES:
+            return "SYLLABLE_RULES"
+        return super().__reduce_ex__(protocol)
+
+    def rule(
+        self,
+        *,
+        values: Iterable[str] = (),
+        nuclei: Iterable[str] = (),
+        rimes: Iterable[str] = (),
+        onsets: Iterable[str] = (),
+        codas: Iterable[str] = (),
+        match: Optional[typing.Callable[[Syllable], bool]] = None,
+    ) -> typing.Callable[[RuleFunction], RuleFunction]:
+        """Decorator to add a rule function at the end of the rule set."""
+
+        def decorator(fn: RuleFunction) -> RuleFunction:
+            self.add(
+                SyllableRule(
+                    name=fn.__name__,
+                    function=fn,
+                    order=len(self.rules),
+                    values=frozenset(values),
+                    nuclei=frozenset(nuclei),
+                    rimes=frozenset(rimes),
+                    onsets=frozenset(onsets),
+                    codas=frozenset(codas),
+                    match=match,
+                )
+            )
+            return fn
+
+        return decorator
+
+    def add(self, rule: SyllableRule) -> None:
+        self.rules.append(rule)
+        # Index on the most selective condition.
+        for kind, index in self.indexes.items():
+            keys = getattr(rule, kind)
+            if keys:
+                for key in keys:
+                    index.setdefault(key, []).append(rule)
+                break
         else:
-            # e.g. juskom (zjukom)
-            return "zju", 1
+            self.unindexed.append(rule)
+        self.dispatch.clear()
+
+    def rules_for(self, syl: Syllable) -> Tuple[SyllableRule, ...]:
+        """Find the rules that may apply to `syl`, in order."""
+        rules = self.dispatch.get(syl.value)
+        if rules is not None:
+            return rules
+        indexes = self.indexes
+        candidates = set(self.unindexed)
+        candidates.update(indexes["values"].get(syl.value, ()))
+        candidates.update(indexes["nuclei"].get(syl.nucleus, ()))
+        candidates.update(indexes["rimes"].get(syl.rime, ()))
+        candidates.update(indexes["onsets"].get(syl.onset, ()))
+        candidates.update(indexes["codas"].get(syl.coda, ()))
+        rules = tuple(
+            rule
+            for rule in sorted(candidates, key=lambda rule: rule.order)
+            if rule.matches(syl)
+        )
+        if len(self.dispatch) >= self.max_dispatch_size:
+            self.dispatch.clear()
+        self.dispatch[syl.value] = rules
+        return rules
+
+    def translate(self, syl: Syllable) -> Tuple[str, int]:
+        parts = SyllableParts(syl.onset, syl.nucleus, syl.coda)
+        for rule in self.rules_for(syl):
+            result = rule.function(syl, parts)
+            if result is not None:
+                return result
+        return parts.onset + parts.nucleus + parts.coda, 1
+
+    def translate_traced(self, syl: Syllable, trace: "RuleTrace") -> Tuple[str, int]:
+        """Translate like `translate()`, counting the rules that fire."""
+        parts = SyllableParts(syl.onset, syl.nucleus, syl.coda)
+        fired = False
+        for rule in self.rules_for(syl):
+            trace.checked[rule.name] += 1
+            before = (parts.onset, parts.nucleus, parts.coda)
+            result = rule.function(syl, parts)
+            if result is not None:
+                trace.fired[rule.name] += 1
+                return result
+            if (parts.onset, parts.nucleus, parts.coda) != before:
+                trace.fired[rule.name] += 1
+                fired = True
+        if not fired:
+            trace.unchanged[syl.value] += 1
+        return parts.onset + parts.nucleus + parts.coda, 1
+
+
+SYLLABLE_RULES = SyllableRuleSet()
+syllable_rule = SYLLABLE_RULES.rule
 
-    #
-    # vowels (klinkers)
-    #
 
+#
+# special cases
+#
+
+
+@syllable_rule(values=["jus"])
+def jus(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    if syl.tail.startswith("t"):
+        # e.g. justitie (justisie)
+        return "jus", 1
+    else:
+        # e.g. juskom (zjukom)
+        return "zju", 1
+
+
+#
+# vowels (klinkers)
+#
+
+
+@syllable_rule(nuclei=["ei", "ij"])
+def ei_ij(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # ei en ij worden è, behalve in -lijk/-lijkheid
-    if syl.nucleus in ("ei", "ij"):
-        if syl.value in ("lijk", "lijks") or (
-            syl.value == "lij" and syl.tail.startswith("k")
-        ):
-            if not syl.head:
-                # e.g. lijk (lèk), lijkwit (lèkwit)
-                nucleus = "è"
-            elif syl.head == "ge":
-                # e.g. gelijk (gelèk), gelijkheid (gelèkhèd)
-                nucleus = "è"
-            elif syl.head.endswith(
-                ("insge", "isge", "onge", "rechts", "tege", "verge")
-            ):
-                # e.g. ongelijk (ongelèk), tegelijk (tegelèk)
-                nucleus = "è"
-            else:
-                # e.g. bangelijk (bangelijk), eigenlijk (ègelijk),
-                # mogelijk (maugelijk),
-                # TODO: aanzienlijk (anzienlek) ?
-                pass
+    if syl.value in ("lijk", "lijks") or (
+        syl.value == "lij" and syl.tail.startswith("k")
+    ):
+        if not syl.head:
+            # e.g. lijk (lèk), lijkwit (lèkwit)
+            out.nucleus = "è"
+        elif syl.head == "ge":
+            # e.g. gelijk (gelèk), gelijkheid (gelèkhèd)
+            out.nucleus = "è"
+        elif syl.head.endswith(("insge", "isge", "onge", "rechts", "tege", "verge")):
+            # e.g. ongelijk (ongelèk), tegelijk (tegelèk)
+            out.nucleus = "è"
         else:
-            # e.g. kijk (kèk), krijg (krèg)
-            nucleus = "è"
+            # e.g. bangelijk (bangelijk), eigenlijk (ègelijk),
+            # mogelijk (maugelijk),
+            # TODO: aanzienlijk (anzienlek) ?
+            pass
+    else:
+        # e.g. kijk (kèk), krijg (krèg)
+        out.nucleus = "è"
+    return None
 
+
+@syllable_rule(nuclei=["oo"], match=lambda syl: not syl.coda.startswith("r"))
+def long_oo(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # lange o wordt au, maar niet voor een -r.
-    if syl.nucleus == "oo" and not syl.coda.startswith("r"):
-        nucleus = "au"
-    elif syl.nucleus == "o" and syl.open:
-        nucleus = "au"
-    elif syl.nucleus in ("ooi", "ooie"):  # pyphen oddity
-        nucleus = "au" + syl.nucleus[2:]
+    out.nucleus = "au"
+    return None
+
+
+@syllable_rule(nuclei=["o"], match=lambda syl: syl.open)
+def open_o(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    out.nucleus = "au"
+    return None
 
-    # au/ou wordt âh
-    if syl.nucleus in ("au", "auw", "ou", "ouw"):
-        # -ouw/-auw verliezen de -w,
-        # e.g. saus, rauw, nou, jouw
-        nucleus = "âh"
-        if syl.value == "houd":
-            # -houd verliest soms de -d
-            if syl.previous and syl.previous.value in (
-                "be",
-                "der",
-                "huis",
-                "in",
-                "ont",
-            ):
-                # e.g. behoud (behâhd), inhoud (inhâhd).
-                pass
-            else:
-                # e.g. houd (hâh), aanhoud (anhâh)
-                coda = ""
-    elif syl.previous and syl.previous.rime == "ou":
-        # -oude- wordt meestal -âhwe-
-        if syl.value == "de":
-            # e.g. oude (âhwe), oudere (âhwere)
-            onset = "w"
-        elif syl.value == "der":
-            # e.g. pashouder (pashâhwâh)
-            onset = "w"
-            nucleus = "âh"
-            coda = ""
-        elif syl.value == "den":
-            onset = "w"
-            nucleus = "e"
-            coda = ""
 
+@syllable_rule(nuclei=["ooi", "ooie"])
+def ooi(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    out.nucleus = "au" + syl.nucleus[2:]  # pyphen oddity
+    return None
+
+
+@syllable_rule(nuclei=["au", "auw", "ou", "ouw"])
+def au_ou(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    # au/ou wordt âh
+    # -ouw/-auw verliezen de -w,
+    # e.g. saus, rauw, nou, jouw
+    out.nucleus = "âh"
+    if syl.value == "houd":
+        # -houd verliest soms de -d
+        if syl.previous and syl.previous.value in ("be", "der", "huis", "in", "ont"):
+            # e.g. behoud (behâhd), inhoud (inhâhd).
+            pass
+        else:
+            # e.g. houd (hâh), aanhoud (anhâh)
+            out.coda = ""
+    return None
+
+
+@syllable_rule(values=["de", "der", "den"])
+def oude(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    # -oude- wordt meestal -âhwe-
+    if not (syl.previous and syl.previous.rime == "ou"):
+        return None
+    if syl.value == "de":
+        # e.g. oude (âhwe), oudere (âhwere)
+        out.onset = "w"
+    elif syl.value == "der":
+        # e.g. pashouder (pashâhwâh)
+        out.onset = "w"
+        out.nucleus = "âh"
+        out.coda = ""
+    elif syl.value == "den":
+        out.onset = "w"
+        out.nucleus = "e"
+        out.coda = ""
+    return None
+
+
+@syllable_rule(nuclei=["ui"])
+def ui(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # - ui wordt ùi
-    if syl.nucleus == "ui":
-        # e.g. rui (rùik)
-        nucleus = "ùi"
+    # e.g. rui (rùik)
+    out.nucleus = "ùi"
+    return None
+
 
+@syllable_rule(nuclei=["eu"], match=lambda syl: not syl.coda.startswith("r"))
+def eu(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # eu wordt ui, behalve als een r volgt
-    if syl.nucleus == "eu" and not syl.coda.startswith("r"):
-        nucleus = "ui"
+    out.nucleus = "ui"
+    return None
 
+
+@syllable_rule(nuclei=["ee", "é", "éé", "ée"], match=lambda syl: syl.rime != "eer")
+def long_e(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # - lange e wordt ei
     #   TODO: er zijn nog meer lange e, maar om dat vast te stellen heb
     #   je de volgende lettergreep nodig
-    if syl.nucleus in ("ee", "é", "éé", "ée") and syl.rime != "eer":
-        nucleus = "ei"
+    out.nucleus = "ei"
+    return None
+
 
+@syllable_rule(values=["a"])
+def ua(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # -ua- wordt -uwa-
-    if syl.value == "a" and syl.previous and syl.previous.rime == "u":
+    if syl.previous and syl.previous.rime == "u":
         # e.g. situatie (situwasie)
-        onset = "w"
+        out.onset = "w"
+    return None
 
-    #
-    # consonants / medeklinkers
-    #
 
-    # -isch wordt -ies, -ische wordt -iese
-    if syl.rime == "isch":
-        # e.g. basisch (basies)
-        return syl.onset + "ies", 1
-    elif syl.rime == "i" and syl.next and syl.next.value in {"sche", "schen"}:
+#
+# consonants / medeklinkers
+#
+
+
+@syllable_rule(rimes=["isch"])
+def isch(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    # -isch wordt -ies
+    # e.g. basisch (basies)
+    return syl.onset + "ies", 1
+
+
+@syllable_rule(rimes=["i"])
+def ische(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    # -ische wordt -iese
+    if syl.next and syl.next.value in {"sche", "schen"}:
         # e.g. basische (basiese), harmonische (harmauniese)
         return syl.onset + "iese", 2
+    return None
+
+
+@syllable_rule(match=lambda syl: syl.value.startswith("cie"))
+def cie(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    # -cie wordt -sie
+    return "s" + syl.value[1:], 1
+
 
-    # -cie wordt -sie, -cieel wordt -sjeil
-    if syl.value.startswith("cie"):
-        return "s" + syl.value[1:], 1
-    elif syl.value == "ci" and syl.next:
+@syllable_rule(values=["ci"])
+def cieel(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    # -cieel wordt -sjeil
+    if syl.next:
         if syl.next.value == "ë":
             # e.g. officiële (offesjeile)
             return "sjei", 2
         elif not syl.next.onset:
             # e.g. officieel (offesjeil)
-            onset = "sj"
-            nucleus = ""
+            out.onset = "sj"
+            out.nucleus = ""
+    return None
 
+
+@syllable_rule(values=["of"])
+def offi(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # offi- wordt offe-
-    if syl.value == "of" and syl.next and syl.next.value == "fi":
+    if syl.next and syl.next.value == "fi":
         # e.g. officieel (offesjeil)
         return "offe", 2
+    return None
+
 
+@syllable_rule(match=lambda syl: len(syl.coda) >= 2 and syl.coda.endswith("t"))
+def final_t(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # uitgang -t na een andere medeklinker vervalt in de meeste gevallen
-    if len(syl.coda) >= 2 and syl.coda.endswith("t"):
+    if syl.coda == "ct":
         # -kt/-ct wordt -k
-        if syl.coda == "ct":
-            # e.g. respect (respek)
-            coda = "k"
-        elif syl.coda.startswith("r"):
-            # e.g. kort (kogt), wordt (wogt), harst (hags)
-            pass  # handled elsewhere
-        elif syl.coda in {"lt", "nt"}:
-            # e.g. valt (valt), vent (vent)
-            pass
-        elif syl.rime == "angt":
-            # e.g. hangt (hank)
-            coda = "nk"
-        else:
-            # e.g. bakt (bak), nacht (nach), zwart (zwagt)
-            coda = syl.coda[:-1]
+        # e.g. respect (respek)
+        out.coda = "k"
+    elif syl.coda.startswith("r"):
+        # e.g. kort (kogt), wordt (wogt), harst (hags)
+        pass  # handled elsewhere
+    elif syl.coda in {"lt", "nt"}:
+        # e.g. valt (valt), vent (vent)
+        pass
+    elif syl.rime == "angt":
+        # e.g. hangt (hank)
+        out.coda = "nk"
+    else:
+        # e.g. bakt (bak), nacht (nach), zwart (zwagt)
+        out.coda = syl.coda[:-1]
+    return None
+
 
+@syllable_rule(onsets=["qu"])
+def qu(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # qua- wordt kwa-, -quent- wordt -kwent-
-    if syl.onset == "qu":
-        # e.g. adequaat (adekwaat)
-        onset = "kw"
+    # e.g. adequaat (adekwaat)
+    out.onset = "kw"
+    return None
 
+
+@syllable_rule(values=["va"])
+def va(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # va- wordt soms ve-
-    if syl.value == "va" and syl.tail.startswith(("kant", "cant")):
+    if syl.tail.startswith(("kant", "cant")):
         # e.g. vakantie (vekansie), vacant (vecant)
         return "ve", 1
+    return None
+
 
+@syllable_rule(onsets=["c"], match=lambda syl: not syl.nucleus.startswith(("i", "e")))
+def c_onset(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # c wordt vaak een k
-    if syl.onset == "c" and not syl.nucleus.startswith(("i", "e")):
-        onset = "k"
-    if syl.coda == "c":
-        coda = "k"
+    out.onset = "k"
+    return None
+
 
+@syllable_rule(codas=["c"])
+def c_coda(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    out.coda = "k"
+    return None
+
+
+@syllable_rule(values=["ti", "tie"])
+def tie(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # -ti- en -tie worden -si- en -sie na een open lettergreep.
     if syl.previous and not syl.previous.coda:
         if syl.value == "ti":
             # e.g. justitioneel (justisiauneil)
-            onset = "s"
-            nucleus = "i"
+            out.onset = "s"
+            out.nucleus = "i"
         elif syl.value == "tie":
             # e.g. politie (poliesie)
-            onset = "s"
-            nucleus = "ie"
+            out.onset = "s"
+            out.nucleus = "ie"
+    return None
+
+
+R_CODAS = ("r", "rs", "rst", "rt", "rts")
+R_CODA_VOWELS = {
+    "e": "âh",
+    "ee": "eâh",
+    "eu": "euâh",
+    "ie": "ieâh",
+    "oo": "oâh",
+    "uu": "uâh",
+}
 
+
+@syllable_rule(match=lambda syl: syl.coda.startswith("r"))
+def r_coda(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # - TODO de r na een korte klank wordt een g
     # - de r na een lange a wordt een h
     # - na overige klanken wordt de r een âh
     # - uitgang -eer wordt -eâh
     # TODO: coda.startswith('r'), e.g. barst (bagst)
     # TODO: drop -t?
-    if syl.coda.startswith("r"):
-        r_codas = ("r", "rs", "rst", "rt", "rts")
-        # todo: -rd? gehoord?
-        vowel_map = {
-            "e": "âh",
-            "ee": "eâh",
-            "eu": "euâh",
-            "ie": "ieâh",
-            "oo": "oâh",
-            "uu": "uâh",
-        }
-        if syl.rime == "ar":
-            # e.g. bar (bâh)
-            nucleus = "âh"
-            coda = ""
-        elif syl.rime == "aar":
-            # e.g. naar (naah)
-            coda = "h"
-        elif syl.nucleus in vowel_map and syl.coda in r_codas:
-            # e.g. lekker (lekkâh), weigert (wègâht), lekkerst (lekkâhst),
-            # duurt (duâht), voorts (voâhts)
-            nucleus = vowel_map[syl.nucleus]
-            coda = syl.coda.lstrip("r")
-
+    # todo: -rd? gehoord?
+    if syl.rime == "ar":
+        # e.g. bar (bâh)
+        out.nucleus = "âh"
+        out.coda = ""
+    elif syl.rime == "aar":
+        # e.g. naar (naah)
+        out.coda = "h"
+    elif syl.nucleus in R_CODA_VOWELS and syl.coda in R_CODAS:
+        # e.g. lekker (lekkâh), weigert (wègâht), lekkerst (lekkâhst),
+        # duurt (duâht), voorts (voâhts)
+        out.nucleus = R_CODA_VOWELS[syl.nucleus]
+        out.coda = syl.coda.lstrip("r")
+    return None
+
+
+@syllable_rule(
+    match=lambda syl: syl.coda.startswith(("l", "r")) and len(syl.coda) > 1
+)
+def liquid_cluster(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # Lettergrepen eindigend op een vloeiklank (l of r) gevolgd
     # door een medeklinker krijgen soms een extra lettergreep:
     # medeklinkerverdubbeling en een tussen-a, tussen-e, of-u.
     if syl.rime == "urg":
         # e.g. voorburg (voâhburrag)
-        coda = "rrag" + syl.coda[3:]
-    elif syl.coda.startswith(("l", "r")) and len(syl.coda) > 1:
+        out.coda = "rrag" + syl.coda[3:]
+    elif syl.coda.startswith(
+        ("lf", "lg", "lk", "lm", "lp", "rf", "rg", "rm", "rn", "rp")
+    ):
         # FIXME: do not clash with r- coda handling above
-        if syl.coda.startswith(
-            ("lf", "lg", "lk", "lm", "lp", "rf", "rg", "rm", "rn", "rp")
-        ):
-            # e.g. volk (volluk), zorg (zorrug)
-            coda = syl.coda[0] + syl.coda[0] + "u" + syl.coda[1:]
-        elif syl.coda.startswith("rk"):
-            # e.g. sterkte (sterrekte)
-            coda = syl.coda[0] + syl.coda[0] + "e" + syl.coda[1:]
+        # e.g. volk (volluk), zorg (zorrug)
+        out.coda = syl.coda[0] + syl.coda[0] + "u" + syl.coda[1:]
+    elif syl.coda.startswith("rk"):
+        # e.g. sterkte (sterrekte)
+        out.coda = syl.coda[0] + syl.coda[0] + "e" + syl.coda[1:]
+    return None
+
 
+@syllable_rule(codas=["md"])
+def md(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
     # -md wordt -mp
-    if syl.coda == "md":
-        # e.g. geruimd (gerùimp)
-        coda = "mp"
+    # e.g. geruimd (gerùimp)
+    out.coda = "mp"
+    return None
+
+
+#
+# suffixes (uitgangen)
+#
 
-    # Suffixes (uitgangen)
-    if syl.head:
 
-        # -ens wordt meestal -es.
-        if syl.rime == "ens":
-            if syl.onset in ("g", "k", "t", "v"):
-                # e.g. volgens (volges), tekens (teikes), gewetens
-                # (geweites), havens (haves)
-                # TODO: uitzonderingen? intens
-                coda = "s"
-            elif syl.onset == "d" and not syl.head.endswith(("ca", "ten")):
-                # e.g. heidens (hèdes), niet cadens, tendens
-                coda = "s"
-            elif syl.onset == "r" and not syl.head.endswith("fo"):
-                # e.g. varens (vares)
-                # TODO: meer uitzonderingen
-                coda = "s"
-            # TODO: -lens  molens cameralens
-            # TODO: -mens  examens aapmens
-            # TODO: -pens  wapens
-            # TODO: -sens kussens
-            # TODO: meer -ens
-
-        # -en wordt -e of -ûh (aan einde zin).
-        # TODO
-        elif syl.rime == "en":
-            coda = ""
-
-    return onset + nucleus + coda, 1
+@syllable_rule(rimes=["ens"])
+def ens(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    # -ens wordt meestal -es.
+    if not syl.head:
+        return None
+    if syl.onset in ("g", "k", "t", "v"):
+        # e.g. volgens (volges), tekens (teikes), gewetens
+        # (geweites), havens (haves)
+        # TODO: uitzonderingen? intens
+        out.coda = "s"
+    elif syl.onset == "d" and not syl.head.endswith(("ca", "ten")):
+        # e.g. heidens (hèdes), niet cadens, tendens
+        out.coda = "s"
+    elif syl.onset == "r" and not syl.head.endswith("fo"):
+        # e.g. varens (vares)
+        # TODO: meer uitzonderingen
+        out.coda = "s"
+    # TODO: -lens  molens cameralens
+    # TODO: -mens  examens aapmens
+    # TODO: -pens  wapens
+    # TODO: -sens kussens
+    # TODO: meer -ens
+    return None
+
+
+@syllable_rule(rimes=["en"])
+def en(syl: Syllable, out: SyllableParts) -> Optional[Tuple[str, int]]:
+    # -en wordt -e of -ûh (aan einde zin).
+    # TODO
+    if syl.head:
+        out.coda = ""
+    return None
 
 
 def pairwise(iterable: Iterable[T]) -> Iterator[Tuple[T, T]]:  # from itertools recipes
@@ -662,22 +1060,311 @@ def pairwise(iterable: Iterable[T]) -> Iterator[Tuple[T, T]]:  # from itertools
     return zip(a, b)
 
 
-hyphenation_dictionary = pyphen.Pyphen(lang="nl", left=1, right=1)
+#
+# Hyphenation
+#
 
+HYPHENATION_LANG = "nl"
+HYPHENATION_LEFT = 1
+HYPHENATION_RIGHT = 1
+
+# Pattern file lines that do not contain patterns.
+HYPHENATION_IGNORED_PREFIXES = (
+    "%",
+    "#",
+    "LEFTHYPHENMIN",
+    "RIGHTHYPHENMIN",
+    "COMPOUNDLEFTHYPHENMIN",
+    "COMPOUNDRIGHTHYPHENMIN",
+)
+HYPHENATION_HEX_RE = re.compile(r"\^{2}([0-9a-f]{2})")
+HYPHENATION_PATTERN_RE = re.compile(r"(\d?)(\D?)")
 
-def split_into_syllables(word: str) -> List[Syllable]:
+
+class Hyphenator:
+    """
+    Hyphenation using Liang's algorithm, as used by TeX and hunspell.
+
+    The patterns from a hunspell ``hyph_*.dic`` file are compiled into
+    a single flat table that maps every prefix of every pattern to the
+    pattern's values (if the prefix is a pattern itself). Matching at a
+    position stops as soon as the text seen so far is not a prefix of
+    any pattern, which avoids most lookups.
+
+    This gives the same results as ``pyphen.Pyphen``.
+    """
+
+    def __init__(self, path: str, left: int = 2, right: int = 2) -> None:
+        self.left = left
+        self.right = right
+        patterns = self.read_patterns(path)
+        self.table: Dict[str, Optional[Tuple[int, Tuple[int, ...]]]] = {}
+        for letters in patterns:
+            for i in range(1, len(letters)):
+                self.table.setdefault(letters[:i], None)
+        self.table.update(patterns)
+
+    @staticmethod
+    def read_patterns(path: str) -> Dict[str, Tuple[int, Tuple[int, ...]]]:
+        """
+        Read patterns as {letters: (offset, values)}.
+
+        Leading and trailing zero values are left out; `offset` is the
+        position of the first non-zero value.
+        """
+        with open(path, "rb") as fp:
+            encoding = fp.readline().decode().strip()
+            if encoding.lower() == "microsoft-cp1251":
+                encoding = "cp1251"
+            lines = fp.read().decode(encoding).split("\n")
+
+        patterns = {}
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith(HYPHENATION_IGNORED_PREFIXES):
+                continue
+            line = HYPHENATION_HEX_RE.sub(lambda m: chr(int(m.group(1), 16)), line)
+            if "/" in line and "=" in line:
+                # Non-standard hyphenation, e.g. "omaatje" -> "oma-tje",
+                # only the split point is used.
+                line = line.split("/", 1)[0]
+            parts = HYPHENATION_PATTERN_RE.findall(line)
+            letters = "".join(letter for _, letter in parts)
+            values = tuple(int(digit or "0") for digit, _ in parts)
+            if not any(values):
+                continue
+            start = 0
+            end = len(values)
+            while not values[start]:
+                start += 1
+            while not values[end - 1]:
+                end -= 1
+            patterns[letters] = (start, values[start:end])
+        return patterns
+
+    def positions(self, word: str) -> List[int]:
+        """Obtain the positions where `word` can be hyphenated."""
+        pointed = "." + word.lower() + "."
+        size = len(pointed)
+        table = self.table
+        points = [0] * (size + 1)
+        for i in range(size - 1):
+            for j in range(i + 1, size + 1):
+                try:
+                    entry = table[pointed[i:j]]
+                except KeyError:
+                    break
+                if entry is None:
+                    continue
+                offset, values = entry
+                pos = i + offset
+                for value in values:
+                    if value > points[pos]:
+                        points[pos] = value
+                    pos += 1
+        first = max(self.left, 0)
+        last = len(word) - self.right
+        return [i - 1 for i in range(first + 1, last + 2) if points[i] % 2]
+
+    def positions_many(self, words: Iterable[str]) -> List[List[int]]:
+        """
+        Obtain hyphenation positions for many words at once.
+
+        Each distinct word is only hyphenated once.
+        """
+        words = list(words)
+        results = {word: self.positions(word) for word in set(words)}
+        return [list(results[word]) for word in words]
+
+
+# Loading the hyphenation patterns is slow, so it is done on first use.
+# The hyphenator is also available as the module attribute
+# `hyphenation_dictionary`.
+_hyphenation_dictionary: Optional[Hyphenator] = None
+_hyphenation_dictionary_lock = threading.Lock()
+
+
+def hyphenation_dictionary_path() -> str:
+    # The patterns are the Dutch hunspell patterns that come with pyphen.
+    import pyphen
+
+    return str(pyphen.LANGUAGES[pyphen.language_fallback(HYPHENATION_LANG)])
+
+
+def get_hyphenation_dictionary() -> Hyphenator:
+    global _hyphenation_dictionary
+    if _hyphenation_dictionary is None:
+        with _hyphenation_dictionary_lock:
+            if _hyphenation_dictionary is None:
+                _hyphenation_dictionary = Hyphenator(
+                    hyphenation_dictionary_path(),
+                    left=HYPHENATION_LEFT,
+                    right=HYPHENATION_RIGHT,
+                )
+    return _hyphenation_dictionary
+
+
+def __getattr__(name: str) -> Any:
+    if name == "hyphenation_dictionary":
+        return get_hyphenation_dictionary()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def hyphenation_dictionary_version() -> str:
+    """
+    Describe the hyphenation patterns, without loading them.
+
+    This changes whenever pyphen or its Dutch dictionary is upgraded.
+    """
+    import pyphen
+
+    path = hyphenation_dictionary_path()
+    return "pyphen={} dictionary={}:{} left={} right={}".format(
+        getattr(pyphen, "__version__", "?"),
+        os.path.basename(path),
+        os.path.getsize(path),
+        HYPHENATION_LEFT,
+        HYPHENATION_RIGHT,
+    )
+
+
+class HyphenationCache:
+    """
+    Persistent cache of hyphenation positions, stored in a SQLite file.
+
+    The file can be shared by many processes, also across restarts. New
+    words are added as they are hyphenated, and written in batches of
+    `flush_every` words. All entries are discarded when the hyphenation
+    dictionary changes.
+    """
+
+    def __init__(self, path: str, flush_every: int = 1000) -> None:
+        self.path = path
+        self.flush_every = flush_every
+        self.version = hyphenation_dictionary_version()
+        self.lock = threading.Lock()
+        self.pending: Dict[str, str] = {}
+        self.pid = -1
+        self.connection: Optional["sqlite3.Connection"] = None
+        self.connect()
+
+    def connect(self) -> "sqlite3.Connection":
+        # Connections can not be used across fork(), so each process
+        # opens its own.
+        if self.connection is not None and self.pid == os.getpid():
+            return self.connection
+        # Imported here, since most uses do not need a cache.
+        import multiprocessing.util
+        import sqlite3
+
+        if self.connection is not None:
+            # Forked child process. Worker processes skip atexit
+            # handlers, but do run multiprocessing finalizers.
+            multiprocessing.util.Finalize(None, self.flush, exitpriority=10)
+        self.pid = os.getpid()
+        self.pending = {}
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA mmap_size = 268435456")
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS positions"
+                " (word TEXT PRIMARY KEY, positions TEXT NOT NULL)"
+            )
+            row = connection.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()
+            if row is None or row[0] != self.version:
+                connection.execute("DELETE FROM positions")
+                connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                    (self.version,),
+                )
+        self.connection = connection
+        return connection
+
+    def get(self, word: str) -> Optional[List[int]]:
+        with self.lock:
+            connection = self.connect()
+            value = self.pending.get(word)
+            if value is None:
+                row = connection.execute(
+                    "SELECT positions FROM positions WHERE word = ?", (word,)
+                ).fetchone()
+                if row is None:
+                    return None
+                value = row[0]
+        return [int(p) for p in value.split(",")] if value else []
+
+    def put(self, word: str, positions: Sequence[int]) -> None:
+        with self.lock:
+            self.connect()
+            self.pending[word] = ",".join(str(int(p)) for p in positions)
+            if len(self.pending) >= self.flush_every:
+                self.flush_pending()
+
+    def flush(self) -> None:
+        with self.lock:
+            self.flush_pending()
+
+    def flush_pending(self) -> None:
+        if not self.pending or self.connection is None or self.pid != os.getpid():
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO positions VALUES (?, ?)", self.pending.items()
+            )
+        self.pending = {}
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush_pending()
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+
+
+hyphenation_cache: Optional[HyphenationCache] = None
+
+
+def set_hyphenation_cache(path: Optional[str]) -> None:
+    """
+    Use a persistent hyphenation cache at `path`, or none at all.
+    """
+    global hyphenation_cache
+    if hyphenation_cache is not None:
+        hyphenation_cache.close()
+        atexit.unregister(hyphenation_cache.close)
+    hyphenation_cache = None
+    if path is not None:
+        hyphenation_cache = HyphenationCache(path)
+        atexit.register(hyphenation_cache.close)
+
+
+def hyphenation_positions(word: str) -> List[int]:
+    cache = hyphenation_cache
+    if cache is not None:
+        positions = cache.get(word)
+        if positions is not None:
+            return positions
+    positions = get_hyphenation_dictionary().positions(word)
+    if cache is not None:
+        cache.put(word, positions)
+    return positions
+
+
+def syllables_from_positions(word: str, positions: Iterable[int]) -> List[Syllable]:
     # The (naive) assumption here is that hyphenation is the same as
-    # syllable splitting. First obtain the split points.
-    positions = [0]
-    positions.extend(hyphenation_dictionary.positions(word))
-    positions.append(len(word))
-    assert len(positions) == len(set(positions))  # all unique
+    # syllable splitting, so the hyphenation positions are the split
+    # points.
+    points = [0, *positions, len(word)]
+    assert len(points) == len(set(points))  # all unique
 
     # Build syllable instances containing all data and context around them.
-    syllables = [
-        Syllable(word[start:stop], head=word[:start], tail=word[stop:])
-        for start, stop in pairwise(positions)
-    ]
+    syllables = [Syllable(word, start, stop) for start, stop in pairwise(points)]
     for i in range(len(syllables)):
         if i > 0:
             syllables[i].previous = syllables[i - 1]
@@ -687,14 +1374,495 @@ def split_into_syllables(word: str) -> List[Syllable]:
     return syllables
 
 
-def translate_using_syllables(word: str) -> str:
-    syllables = split_into_syllables(word)
-    out = []
-    while syllables:
-        translated, n = translate_syllable(syllables[0])
-        out.append(translated)
-        syllables = syllables[n:]
-    return "".join(out)
+#
+# Caching
+#
+
+
+@attr.s(frozen=True, slots=True)
+class CacheInfo:
+    hits: int = attr.ib()
+    misses: int = attr.ib()
+    evictions: int = attr.ib()
+    maxsize: int = attr.ib()
+    currsize: int = attr.ib()
+    maxbytes: int = attr.ib(default=0)
+    currbytes: int = attr.ib(default=0)
+    skipped: int = attr.ib(default=0)
+
+
+def entry_size(key: typing.Hashable, value: str) -> int:
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+@attr.s(slots=True)
+class LRUCache:
+    """
+    Size-bounded mapping that evicts the least recently used entries.
+
+    A `maxsize` of 0 disables the cache. A non-zero `maxbytes` also
+    limits the (approximate) memory used by keys and values. All
+    operations are thread-safe. Copies (and pickles) start out empty.
+    """
+
+    maxsize: int = attr.ib()
+    maxbytes: int = attr.ib(default=0)
+    hits: int = attr.ib(default=0, init=False)
+    misses: int = attr.ib(default=0, init=False)
+    evictions: int = attr.ib(default=0, init=False)
+    currbytes: int = attr.ib(default=0, init=False)
+    data: typing.OrderedDict[typing.Hashable, str] = attr.ib(
+        factory=collections.OrderedDict, init=False, repr=False
+    )
+    lock: threading.Lock = attr.ib(
+        factory=threading.Lock, init=False, repr=False, eq=False
+    )
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        fields = attr.fields(type(self))
+        limits = {a.name: getattr(self, a.name) for a in fields if a.init}
+        return (functools.partial(type(self), **limits), ())
+
+    def get(self, key: typing.Hashable) -> Optional[str]:
+        # Misses do not take the lock, which makes their count
+        # approximate under concurrent use. Hits reorder the entries, so
+        # they do: without it, this races with evictions on builds
+        # without a global interpreter lock.
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        # Calling acquire() directly is cheaper than a with block.
+        self.lock.acquire()
+        try:
+            self.hits += 1
+            self.data.move_to_end(key)
+        except KeyError:  # evicted by another thread
+            pass
+        finally:
+            self.lock.release()
+        return value
+
+    def put(self, key: typing.Hashable, value: str) -> None:
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            previous = self.data.pop(key, None)
+            if previous is not None:
+                self.currbytes -= entry_size(key, previous)
+            self.data[key] = value
+            self.currbytes += entry_size(key, value)
+            self.evict()
+
+    def evict(self) -> None:
+        # Callers hold the lock.
+        while len(self.data) > self.maxsize or (
+            self.maxbytes > 0 and self.currbytes > self.maxbytes
+        ):
+            key, value = self.data.popitem(last=False)
+            self.currbytes -= entry_size(key, value)
+            self.evictions += 1
+
+    def resize(self, maxsize: int, maxbytes: Optional[int] = None) -> None:
+        with self.lock:
+            self.maxsize = maxsize
+            if maxbytes is not None:
+                self.maxbytes = maxbytes
+            self.evict()
+
+    def clear(self) -> None:
+        """Remove all entries and reset the statistics."""
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = self.evictions = self.currbytes = 0
+
+    def info(self) -> CacheInfo:
+        with self.lock:
+            return CacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                maxsize=self.maxsize,
+                currsize=len(self.data),
+                maxbytes=self.maxbytes,
+                currbytes=self.currbytes,
+            )
+
+
+# Longest input for which complete translations are cached. Longer
+# inputs are unlikely to repeat, and would push out many short ones.
+RESULT_CACHE_MAX_LENGTH = 1000
+
+
+@attr.s(slots=True)
+class ResultCache(LRUCache):
+    """
+    Cache for complete translations, keyed on a digest of the input.
+
+    Inputs longer than `max_length` are not cached, and counted as
+    skipped instead. Disabled (a `maxsize` of 0) by default.
+    """
+
+    maxsize: int = attr.ib(default=0)
+    max_length: int = attr.ib(default=RESULT_CACHE_MAX_LENGTH)
+    skipped: int = attr.ib(default=0, init=False)
+
+    @staticmethod
+    def key(s: str) -> bytes:
+        return hashlib.blake2b(
+            s.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+
+    def lookup(self, s: str) -> Optional[str]:
+        if len(s) > self.max_length:
+            with self.lock:
+                self.skipped += 1
+            return None
+        return self.get(self.key(s))
+
+    def store(self, s: str, translated: str) -> None:
+        if len(s) <= self.max_length:
+            self.put(self.key(s), translated)
+
+    def clear(self) -> None:
+        LRUCache.clear(self)
+        with self.lock:
+            self.skipped = 0
+
+    def info(self) -> CacheInfo:
+        info = LRUCache.info(self)
+        with self.lock:
+            return attr.evolve(info, skipped=self.skipped)
+
+
+#
+# Lexicon
+#
+
+# Binary lexicon file layout (little endian):
+#
+# - header: magic, format version, number of entries, number of
+#   buckets (a power of two), length of the version string
+# - the version string (utf-8)
+# - buckets: one u32 record offset per bucket, 0 for empty buckets
+# - records: u16 key length, u16 value length, key, value (utf-8)
+#
+# Buckets are found using the crc32 of the key, with linear probing. A
+# value length of LEXICON_SAME means that the word translates to itself.
+LEXICON_MAGIC = b"HAAGSLEX"
+LEXICON_FORMAT = 1
+LEXICON_HEADER = struct.Struct("<8sIIII")
+LEXICON_RECORD = struct.Struct("<HH")
+LEXICON_BUCKET = struct.Struct("<I")
+LEXICON_SAME = 0xFFFF
+
+
+def write_lexicon(
+    path: str, translations: typing.Mapping[str, str], version: str = ""
+) -> None:
+    """Write a binary lexicon file for `translations`."""
+    n_buckets = 1
+    while n_buckets < 2 * len(translations):
+        n_buckets *= 2
+    mask = n_buckets - 1
+    version_bytes = version.encode("utf-8")
+    records_offset = (
+        LEXICON_HEADER.size + len(version_bytes) + n_buckets * LEXICON_BUCKET.size
+    )
+    buckets = [0] * n_buckets
+    records = []
+    offset = records_offset
+    for word in sorted(translations):
+        translated = translations[word]
+        key = word.encode("utf-8")
+        value = b"" if translated == word else translated.encode("utf-8")
+        if len(key) >= LEXICON_SAME or len(value) >= LEXICON_SAME:
+            continue  # not worth storing
+        bucket = zlib.crc32(key) & mask
+        while buckets[bucket]:
+            bucket = (bucket + 1) & mask
+        buckets[bucket] = offset
+        value_size = LEXICON_SAME if translated == word else len(value)
+        record = LEXICON_RECORD.pack(len(key), value_size) + key + value
+        records.append(record)
+        offset += len(record)
+    if offset > 0xFFFFFFFF:
+        raise ValueError("lexicon too large")
+
+    with open(path, "wb") as fp:
+        fp.write(
+            LEXICON_HEADER.pack(
+                LEXICON_MAGIC,
+                LEXICON_FORMAT,
+                len(records),
+                n_buckets,
+                len(version_bytes),
+            )
+        )
+        fp.write(version_bytes)
+        bucket_array = array.array("I", buckets)
+        assert bucket_array.itemsize == LEXICON_BUCKET.size
+        if sys.byteorder != "little":
+            bucket_array.byteswap()
+        fp.write(bucket_array.tobytes())
+        fp.writelines(records)
+
+
+class Lexicon:
+    """
+    Read-only word -> translation lookup table in a memory-mapped file.
+
+    Opening a lexicon does not read the entries, and processes using
+    the same file share its pages. A warning is issued if the lexicon
+    was built with other hyphenation patterns than the current ones.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as fp:
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        header = LEXICON_HEADER.unpack_from(self.data)
+        magic, format, self.size, n_buckets, version_size = header
+        if magic != LEXICON_MAGIC or format != LEXICON_FORMAT:
+            raise ValueError("{} is not a haags lexicon".format(path))
+        self.mask = n_buckets - 1
+        start = LEXICON_HEADER.size
+        self.version = bytes(self.data[start : start + version_size]).decode("utf-8")
+        self.buckets_offset = start + version_size
+        if self.version and self.version != hyphenation_dictionary_version():
+            warnings.warn(
+                "{} was built for other hyphenation patterns ({}); "
+                "rebuild it".format(path, self.version),
+                stacklevel=2,
+            )
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getstate__(self) -> str:
+        # Memory maps can not be pickled; open the file again instead.
+        return self.path
+
+    def __setstate__(self, path: str) -> None:
+        self.__init__(path)  # type: ignore[misc]
+
+    def get(self, word: str) -> Optional[str]:
+        data = self.data
+        key = word.encode("utf-8")
+        bucket = zlib.crc32(key) & self.mask
+        while True:
+            (offset,) = LEXICON_BUCKET.unpack_from(
+                data, self.buckets_offset + bucket * LEXICON_BUCKET.size
+            )
+            if not offset:
+                return None
+            key_size, value_size = LEXICON_RECORD.unpack_from(data, offset)
+            start = offset + LEXICON_RECORD.size
+            if key_size == len(key) and data[start : start + key_size] == key:
+                if value_size == LEXICON_SAME:
+                    return word
+                start += key_size
+                return data[start : start + value_size].decode("utf-8")
+            bucket = (bucket + 1) & self.mask
+
+    def close(self) -> None:
+        self.data.close()
+
+
+#
+# Instrumentation
+#
+
+# Stages of a translation, timed separately when instrumented. Words are
+# only hyphenated and split into syllables when they are not cached, so
+# "words" includes "hyphenation" and "syllables".
+STAGES = ["tokenize", "contractions", "words", "hyphenation", "syllables", "assemble"]
+
+# Stages for which memory use is measured.
+MEMORY_STAGES = ["tokenize", "contractions", "words", "assemble"]
+
+
+@attr.s(slots=True)
+class TranslationStats:
+    """
+    Timings and counters for one or more translations.
+
+    Times are wall clock seconds. When measuring memory, `peak_memory`
+    is the largest number of bytes in use by each stage (at its peak,
+    relative to its start) in a single call, and `retained_blocks` is
+    the total number of memory blocks that each stage allocated and still
+    holds when it ends. Blocks freed within a stage are not counted.
+    """
+
+    calls: int = attr.ib(default=0)
+    chars: int = attr.ib(default=0)
+    elapsed: float = attr.ib(default=0.0)
+    times: Dict[str, float] = attr.ib(factory=lambda: dict.fromkeys(STAGES, 0.0))
+    tokens: Dict[str, int] = attr.ib(factory=lambda: dict.fromkeys(TOKEN_TYPES, 0))
+    contractions: int = attr.ib(default=0)
+    words: int = attr.ib(default=0)
+    cache_hits: int = attr.ib(default=0)
+    cache_misses: int = attr.ib(default=0)
+    result_cache_hits: int = attr.ib(default=0)
+    peak_memory: Dict[str, int] = attr.ib(
+        factory=lambda: dict.fromkeys(MEMORY_STAGES, 0)
+    )
+    retained_blocks: Dict[str, int] = attr.ib(
+        factory=lambda: dict.fromkeys(MEMORY_STAGES, 0)
+    )
+
+    def add(self, other: "TranslationStats") -> None:
+        self.calls += other.calls
+        self.chars += other.chars
+        self.elapsed += other.elapsed
+        for stage, seconds in other.times.items():
+            self.times[stage] += seconds
+        for type, count in other.tokens.items():
+            self.tokens[type] += count
+        self.contractions += other.contractions
+        self.words += other.words
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.result_cache_hits += other.result_cache_hits
+        for stage, size in other.peak_memory.items():
+            self.peak_memory[stage] = max(self.peak_memory[stage], size)
+        for stage, count in other.retained_blocks.items():
+            self.retained_blocks[stage] += count
+
+    def record_memory(self, stage: str, start: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Record the memory use of a stage that started at `start`.
+
+        Returns the memory in use now, as bytes and blocks, which is also
+        the start of the next stage.
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peak_memory[stage] = max(self.peak_memory[stage], peak - start[0])
+        blocks = traced_blocks()
+        self.retained_blocks[stage] += max(0, blocks - start[1])
+        # Taking the snapshot changes the memory in use, and its peak.
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0], blocks
+
+
+def traced_blocks() -> int:
+    """Count the memory blocks in use that are traced by `tracemalloc`."""
+    return len(tracemalloc.take_snapshot().traces)
+
+
+@attr.s(slots=True)
+class RuleTrace:
+    """
+    Counts of the rules and overrides used for translation.
+
+    `fired` counts syllable rules (by name) that changed or produced a
+    translation, and the "WORDS", "lexicon" and "SYLLABLES" overrides.
+    `checked` counts syllable rules that ran at all. Words that are
+    translated syllable by syllable are counted in `fallthrough`, and
+    syllables that no rule changed in `unchanged`.
+    """
+
+    fired: typing.Counter[str] = attr.ib(factory=collections.Counter)
+    checked: typing.Counter[str] = attr.ib(factory=collections.Counter)
+    fallthrough: typing.Counter[str] = attr.ib(factory=collections.Counter)
+    unchanged: typing.Counter[str] = attr.ib(factory=collections.Counter)
+
+    def summary(
+        self, rules: Optional["SyllableRuleSet"] = None, n: int = 10
+    ) -> Dict[str, Any]:
+        """Summarise the trace as JSON compatible data."""
+        names = [rule.name for rule in (rules or SYLLABLE_RULES).rules]
+        return {
+            "hottest": self.fired.most_common(n),
+            "never_fired": [name for name in names if not self.fired[name]],
+            "never_checked": [name for name in names if not self.checked[name]],
+            "fallthrough": self.fallthrough.most_common(n),
+            "unchanged": self.unchanged.most_common(n),
+        }
+
+
+# Trace collected by the current `trace_rules()` block, if any.
+tracing: "contextvars.ContextVar[Optional[RuleTrace]]"
+tracing = contextvars.ContextVar("tracing", default=None)
+
+
+@contextlib.contextmanager
+def trace_rules() -> Iterator[RuleTrace]:
+    """
+    Count which rules and overrides fire for all translations in this block.
+
+    The word cache is bypassed while tracing, so that the counts reflect
+    all words, and not just the distinct ones.
+    """
+    trace = RuleTrace()
+    token = tracing.set(trace)
+    try:
+        yield trace
+    finally:
+        tracing.reset(token)
+
+
+StatsCallback = typing.Callable[[TranslationStats], None]
+
+# Statistics collected by the current `instrument()` block, if any. This
+# is per thread (and per asyncio task).
+instrumentation: "contextvars.ContextVar[Optional[Tuple[TranslationStats, Any, bool]]]"
+instrumentation = contextvars.ContextVar("instrumentation", default=None)
+
+# Threads started by `translate_many()` share the totals of the block
+# that started them.
+instrumentation_lock = threading.Lock()
+
+# Statistics of the `translate()` call in progress, while instrumented.
+# Word translation adds its cache misses and timings to these.
+call_stats: "contextvars.ContextVar[Optional[TranslationStats]]"
+call_stats = contextvars.ContextVar("call_stats", default=None)
+
+
+@contextlib.contextmanager
+def instrument(
+    callback: Optional[StatsCallback] = None, *, memory: bool = False
+) -> Iterator[TranslationStats]:
+    """
+    Collect statistics for all translations in this block.
+
+    Yields the totals. If given, `callback` is also called with the
+    statistics of every single `translate()` or `translate_document()`
+    call. Translations outside an instrumented block are not slowed down.
+
+    Threads used by `translate_many()` and `translate_parallel()` are
+    included, in which case `callback` is called from those threads.
+    Worker processes are not: with processes, only the totals of
+    `translate_document()` are collected, and nothing for the other
+    functions.
+
+    With `memory=True`, the peak memory use and the retained memory
+    blocks of each stage are measured using `tracemalloc`, which makes
+    translation a lot slower.
+    """
+    total = TranslationStats()
+    start_tracing = memory and not tracemalloc.is_tracing()
+    if start_tracing:
+        tracemalloc.start()
+    token = instrumentation.set((total, callback, memory))
+    try:
+        yield total
+    finally:
+        instrumentation.reset(token)
+        if start_tracing:
+            tracemalloc.stop()
+
+
+def record_stats(stats: TranslationStats) -> None:
+    """Add `stats` to the current `instrument()` block, if any."""
+    state = instrumentation.get()
+    if state is None:
+        return
+    total, callback, _ = state
+    with instrumentation_lock:
+        total.add(stats)
+    if callback is not None:
+        callback(stats)
 
 
 #
@@ -713,27 +1881,1324 @@ WORDS = {
 }
 
 
-def translate_single_word_token(token: Token) -> Token:
-    translated = WORDS.get(token.value_lower)
-    if translated is None:
-        translated = translate_using_syllables(token.value_lower)
-    return Token(recase(translated, token.case), "word")
+#
+# Alignment
+#
 
 
-def apply_single_words(tokens: Sequence[Token]) -> List[Token]:
-    return [
-        translate_single_word_token(token) if token.type == "word" else token
-        for token in tokens
-    ]
+@attr.s(frozen=True, slots=True, eq=False)
+class Alignment:
+    """
+    Mapping between input and output offsets of a translation.
+
+    Segment `i` of the input, ``source[i]:source[i + 1]``, translates to
+    ``target[i]:target[i + 1]`` of the output. Segments are tokens,
+    except that a contraction of several words is a single segment.
+    """
+
+    source: "array.array[int]" = attr.ib()
+    target: "array.array[int]" = attr.ib()
+
+    @classmethod
+    def for_text(cls, s: str) -> "Alignment":
+        # Translations are hardly ever much longer than their input.
+        typecode = OFFSET_TYPECODE if len(s) < 2**31 else "q"
+        return cls(array.array(typecode), array.array(typecode))
+
+    def add(self, source: int, target: int) -> None:
+        self.source.append(source)
+        self.target.append(target)
+
+    def __len__(self) -> int:
+        return max(0, len(self.source) - 1)
+
+    def source_span(self, i: int) -> Tuple[int, int]:
+        return self.source[i], self.source[i + 1]
+
+    def target_span(self, i: int) -> Tuple[int, int]:
+        return self.target[i], self.target[i + 1]
+
+    def segment_at(self, offset: int) -> int:
+        """Find the segment containing input `offset`."""
+        return max(0, min(len(self) - 1, bisect.bisect_right(self.source, offset) - 1))
+
+    def to_target(self, start: int, stop: int) -> Tuple[int, int]:
+        """Map an input span to the output span of the segments it touches."""
+        if not len(self):
+            return 0, 0
+        first = self.segment_at(start)
+        last = self.segment_at(stop - 1) if stop > start else first
+        return self.target[first], self.target[last + 1]
+
+
+#
+# Translator
+#
+
+# Translations of lowercased words, before recasing, for the default
+# translator.
+word_cache = LRUCache(maxsize=10000)
+
+# Complete translations for the default translator; see
+# `set_result_cache()`.
+result_cache = ResultCache()
+
+
+def freeze_mapping(mapping: typing.Mapping[str, str]) -> typing.Mapping[str, str]:
+    return types.MappingProxyType(dict(mapping))
+
+
+@attr.s(frozen=True, slots=True, eq=False)
+class Translator:
+    """
+    Translator with its own words, syllables and contractions.
+
+    All lookup tables are copied into read-only mappings and compiled
+    once, so a translator can be shared between threads and processes;
+    copies sent to other processes start with empty caches. Use
+    `extended()` to create variants.
+    """
+
+    words: typing.Mapping[str, str] = attr.ib(
+        default=WORDS, converter=freeze_mapping, repr=False
+    )
+    syllables: typing.Mapping[str, str] = attr.ib(
+        default=SYLLABLES, converter=freeze_mapping, repr=False
+    )
+    contractions: typing.Mapping[str, str] = attr.ib(
+        default=ALL_CONTRACTIONS, converter=freeze_mapping, repr=False
+    )
+    rules: SyllableRuleSet = attr.ib(default=SYLLABLE_RULES, repr=False)
+
+    # Hyphenator to use instead of the (lazily loaded) default one.
+    hyphenator: Optional[Hyphenator] = attr.ib(default=None, repr=False)
+
+    word_cache: LRUCache = attr.ib(
+        factory=lambda: LRUCache(maxsize=10000), repr=False
+    )
+    result_cache: ResultCache = attr.ib(factory=ResultCache, repr=False)
+
+    # Precompiled translations, consulted before the syllable rules.
+    lexicon: Optional[Lexicon] = attr.ib(default=None, repr=False)
+
+    contraction_trie: ContractionNode = attr.ib(init=False, repr=False)
+    contraction_max_words: int = attr.ib(init=False, repr=False)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # Read-only mappings cannot be pickled, so a copy (e.g. for a
+        # worker process) is created from plain dicts, with empty caches.
+        fields = attr.fields(type(self))
+        args = {a.name: getattr(self, a.name) for a in fields if a.init}
+        for name in ("words", "syllables", "contractions"):
+            args[name] = dict(args[name])
+        return (functools.partial(type(self), **args), ())
+
+    @contraction_trie.default
+    def default_contraction_trie(self) -> ContractionNode:
+        return build_contraction_trie(self.contractions)
+
+    @contraction_max_words.default
+    def default_contraction_max_words(self) -> int:
+        return max((len(dutch.split()) for dutch in self.contractions), default=0)
+
+    def extended(
+        self,
+        *,
+        words: Optional[typing.Mapping[str, str]] = None,
+        syllables: Optional[typing.Mapping[str, str]] = None,
+        contractions: Optional[typing.Mapping[str, str]] = None,
+    ) -> "Translator":
+        """
+        Create a new translator with additional (or replaced) entries.
+
+        The new translator has its own, empty, caches.
+        """
+        return attr.evolve(
+            self,
+            words={**self.words, **(words or {})},
+            syllables={**self.syllables, **(syllables or {})},
+            contractions={**self.contractions, **(contractions or {})},
+            word_cache=LRUCache(maxsize=self.word_cache.maxsize),
+            result_cache=ResultCache(
+                maxsize=self.result_cache.maxsize,
+                maxbytes=self.result_cache.maxbytes,
+                max_length=self.result_cache.max_length,
+            ),
+        )
+
+    def warmup(self) -> None:
+        """
+        Load everything needed for translation.
+
+        This happens automatically on first use, but long running services
+        may prefer to pay the cost up front.
+        """
+        if self.hyphenator is None:
+            get_hyphenation_dictionary()
+        self.translate_using_syllables("warmup")
+
+    #
+    # Contractions
+    #
+
+    def find_contractions(
+        self, tokens: typing.Union[TokenStream, Sequence[Token]]
+    ) -> typing.DefaultDict[int, List[Tuple[int, int, str]]]:
+        """
+        Find all candidate contractions in a single pass over `tokens`.
+
+        Candidates are space separated words ("word space word ...") that
+        form a path through the contraction trie. The result maps the
+        number of words to a list of (start, stop, replacement) tuples,
+        ordered by position.
+        """
+        stream = as_token_stream(tokens)
+        types = stream.types
+        lower = stream.lower
+        candidates: typing.DefaultDict[
+            int, List[Tuple[int, int, str]]
+        ] = collections.defaultdict(list)
+        root = self.contraction_trie.children
+        n_tokens = len(types)
+        for start in range(n_tokens):
+            if types[start] != WORD:
+                continue
+            node = root.get(lower(start))
+            size = 1
+            pos = start  # position of the last word
+            while node is not None:
+                if node.replacement is not None and is_contraction_end(types, pos + 1):
+                    candidates[size].append((start, pos + 1, node.replacement))
+                if not (
+                    pos + 2 < n_tokens
+                    and types[pos + 1] == WHITESPACE
+                    and types[pos + 2] == WORD
+                ):
+                    break
+                pos += 2
+                size += 1
+                node = node.children.get(lower(pos))
+        return candidates
+
+    def select_contractions(self, stream: TokenStream) -> Dict[int, Tuple[int, str]]:
+        """
+        Decide which contractions to apply.
+
+        Returns a mapping from start position to (stop, replacement).
+        """
+        # Contractions are found by walking a trie of lowercased words for
+        # each word in the token stream, e.g. "word space word space word"
+        # is a candidate for a 3 word contraction. Long matches win over
+        # short ones, e.g. 4 words, then 3 words, and so on; matches of the
+        # same size are taken from left to right.
+        candidates = self.find_contractions(stream)
+        used = bytearray(len(stream))
+        replacements: Dict[int, Tuple[int, str]] = {}
+        for size in sorted(candidates, reverse=True):
+            for start, stop, replacement in candidates[size]:
+                if any(used[start:stop]):
+                    continue
+                used[start:stop] = b"\x01" * (stop - start)
+                replacements[start] = (stop, replacement)
+        return replacements
+
+    def apply_contractions(self, tokens: Sequence[Token]) -> List[Token]:
+        tokens = list(tokens)
+        stream = TokenStream.from_tokens(tokens)
+        replacements = self.select_contractions(stream)
+        if not replacements:
+            return tokens
+
+        result = []
+        pos = 0
+        while pos < len(tokens):
+            if pos in replacements:
+                stop, replacement = replacements[pos]
+                replacement = recase(replacement, detect_case(tokens[pos].value))
+                result.append(Token(replacement, "translated"))
+                pos = stop
+            else:
+                result.append(tokens[pos])
+                pos += 1
+        return result
+
+    #
+    # Syllables and words
+    #
+
+    def hyphenate(self, word: str) -> List[int]:
+        if self.hyphenator is None:
+            return hyphenation_positions(word)
+        return self.hyphenator.positions(word)
+
+    def hyphenate_many(self, words: Sequence[str]) -> List[List[int]]:
+        if self.hyphenator is not None:
+            return self.hyphenator.positions_many(words)
+        if hyphenation_cache is None:
+            return get_hyphenation_dictionary().positions_many(words)
+        return [hyphenation_positions(word) for word in words]
+
+    def split_into_syllables(self, word: str) -> List[Syllable]:
+        return syllables_from_positions(word, self.hyphenate(word))
+
+    def translate_syllable(self, syl: Syllable) -> Tuple[str, int]:
+        trace = tracing.get()
+        translated = self.syllables.get(syl.value)
+        if translated is not None:
+            if trace is not None:
+                trace.fired["SYLLABLES"] += 1
+            return translated, 1
+        if trace is not None:
+            return self.rules.translate_traced(syl, trace)
+        return self.rules.translate(syl)
+
+    def translate_syllables(self, syllables: Sequence[Syllable]) -> str:
+        out = []
+        while syllables:
+            translated, n = self.translate_syllable(syllables[0])
+            out.append(translated)
+            syllables = syllables[n:]
+        return "".join(out)
+
+    def translate_using_syllables(self, word: str) -> str:
+        stats = call_stats.get()
+        if stats is None:
+            return self.translate_syllables(self.split_into_syllables(word))
+        t0 = time.perf_counter()
+        syllables = self.split_into_syllables(word)
+        t1 = time.perf_counter()
+        translated = self.translate_syllables(syllables)
+        stats.times["hyphenation"] += t1 - t0
+        stats.times["syllables"] += time.perf_counter() - t1
+        return translated
+
+    def translate_word(self, word: str) -> str:
+        """Translate a single lowercased word."""
+        translated = self.lookup_word(word)
+        if translated is None:
+            translated = self.translate_using_syllables(word)
+        return translated
+
+    def lookup_word(self, word: str) -> Optional[str]:
+        """
+        Look up a lowercased word in the word table and the lexicon.
+
+        Returns None for words that are translated syllable by syllable.
+        While tracing, this counts the overrides and the fallthrough.
+        """
+        trace = tracing.get()
+        translated = self.words.get(word)
+        if translated is not None:
+            if trace is not None:
+                trace.fired["WORDS"] += 1
+            return translated
+        if self.lexicon is not None:
+            translated = self.lexicon.get(word)
+            if translated is not None:
+                if trace is not None:
+                    trace.fired["lexicon"] += 1
+                return translated
+        if trace is not None:
+            trace.fallthrough[word] += 1
+        return None
+
+    def translate_word_cached(self, word: str) -> str:
+        """
+        Translate a single lowercased word, using the word cache.
+
+        The cache is bypassed while tracing.
+        """
+        if tracing.get() is not None:
+            return self.translate_word(word)
+        translated = self.word_cache.get(word)
+        if translated is None:
+            stats = call_stats.get()
+            if stats is not None:
+                stats.cache_misses += 1
+            translated = self.translate_word(word)
+            self.word_cache.put(word, translated)
+        return translated
+
+    def translate_word_value(self, value: str) -> str:
+        """Translate a single word, keeping its letter case."""
+        return recase(self.translate_word_cached(value.lower()), detect_case(value))
+
+    def translate_single_word_token(self, token: Token) -> Token:
+        return Token(self.translate_word_value(token.value), "word")
+
+    def apply_single_words(self, tokens: Sequence[Token]) -> List[Token]:
+        return [
+            self.translate_single_word_token(token) if token.type == "word" else token
+            for token in tokens
+        ]
+
+    #
+    # Text
+    #
+
+    def translate_words(self, words: Iterable[str]) -> Dict[str, str]:
+        """
+        Translate a vocabulary of lowercased words.
+
+        Each distinct word is translated once, and all words that need
+        it are hyphenated in one batch. The word cache is not used.
+        """
+        result = {}
+        unknown = []
+        for word in set(words):
+            translated = self.lookup_word(word)
+            if translated is None:
+                unknown.append(word)
+            else:
+                result[word] = translated
+        for word, positions in zip(unknown, self.hyphenate_many(unknown)):
+            syllables = syllables_from_positions(word, positions)
+            result[word] = self.translate_syllables(syllables)
+        return result
+
+    def compile_lexicon(self, words: Iterable[str], path: str) -> None:
+        """
+        Translate `words` ahead of time and write them to a lexicon file.
+
+        Words are lowercased. The lexicon is only valid for this
+        translator's tables and rules, and the hyphenation patterns used
+        to build it; rebuild it when those change.
+        """
+        translations = self.translate_words(word.lower() for word in words)
+        write_lexicon(path, translations, version=hyphenation_dictionary_version())
+
+    def translate_token_stream(
+        self,
+        stream: TokenStream,
+        translations: Optional[typing.Mapping[str, str]] = None,
+        replacements: Optional[Dict[int, Tuple[int, str]]] = None,
+        alignment: Optional["Alignment"] = None,
+    ) -> str:
+        """
+        Translate a token stream.
+
+        Words are looked up in `translations` (lowercased) if given, and
+        translated using the word cache otherwise. Contractions are found
+        unless `replacements` (from `select_contractions()`) is given. If
+        `alignment` is given, the offsets of all tokens are added to it.
+        """
+        text = stream.text
+        types = stream.types
+        bounds = stream.bounds
+        if replacements is None:
+            replacements = self.select_contractions(stream)
+        translate_word_value = self.translate_word_value
+        out = []
+        copy_from = 0  # start of untranslated text that is not yet copied
+        shift = 0  # output offset minus input offset for copied text
+        pos = 0
+        n_tokens = len(types)
+        while pos < n_tokens:
+            if pos in replacements:
+                start = bounds[pos]
+                stop, replacement = replacements[pos]
+                translated = recase(replacement, detect_case(stream.value(pos)))
+                out.append(text[copy_from:start])
+                out.append(translated)
+                copy_from = bounds[stop]
+                if alignment is not None:
+                    alignment.add(start, start + shift)
+                    shift += len(translated) - (copy_from - start)
+                pos = stop
+            elif types[pos] == WORD:
+                start = bounds[pos]
+                stop = bounds[pos + 1]
+                value = text[start:stop]
+                if translations is None:
+                    translated = translate_word_value(value)
+                else:
+                    translated = recase(
+                        translations[value.lower()], detect_case(value)
+                    )
+                out.append(text[copy_from:start])
+                out.append(translated)
+                copy_from = stop
+                if alignment is not None:
+                    alignment.add(start, start + shift)
+                    shift += len(translated) - (stop - start)
+                pos += 1
+            else:
+                if alignment is not None:
+                    alignment.add(bounds[pos], bounds[pos] + shift)
+                pos += 1
+        out.append(text[copy_from:])
+        if alignment is not None:
+            alignment.add(len(text), len(text) + shift)
+        return "".join(out)
+
+    def vocabulary(
+        self,
+        stream: TokenStream,
+        replacements: Optional[Dict[int, Tuple[int, str]]] = None,
+    ) -> typing.Set[str]:
+        """
+        Collect the distinct lowercased words that need translation.
+
+        Contractions are found unless `replacements` (from
+        `select_contractions()`) is given.
+        """
+        if replacements is None:
+            replacements = self.select_contractions(stream)
+        types = stream.types
+        words = set()
+        pos = 0
+        while pos < len(types):
+            if pos in replacements:
+                pos = replacements[pos][0]
+                continue
+            if types[pos] == WORD:
+                words.add(stream.lower(pos))
+            pos += 1
+        return words
+
+    def translate_document(
+        self, s: str, workers: int = 1, batch_size: int = 2000
+    ) -> str:
+        """
+        Translate a large document, translating each distinct word once.
+
+        The distinct words of the document are collected first, then
+        translated in batches of `batch_size`, using `workers` processes
+        if more than one. The result is the same as `translate(s)`.
+        """
+        t0 = time.perf_counter()
+        stream = TokenStream.from_text(s)
+        t1 = time.perf_counter()
+        replacements = self.select_contractions(stream)
+        t2 = time.perf_counter()
+        words = sorted(self.vocabulary(stream, replacements))
+        translations: Optional[Dict[str, str]] = None
+        if tracing.get() is not None:
+            # Leave the words to translate_token_stream(), which translates
+            # every occurrence, so that rules are counted as for translate().
+            pass
+        elif workers > 1 and len(words) > batch_size:
+            import concurrent.futures
+
+            translations = {}
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_worker,
+                initargs=(self,),
+            ) as executor:
+                batches = batched(words, batch_size)
+                for result in executor.map(translate_words_in_worker, batches):
+                    translations.update(result)
+        else:
+            translations = self.translate_words(words)
+        t3 = time.perf_counter()
+        translated = self.translate_token_stream(stream, translations, replacements)
+        if instrumentation.get() is not None:
+            stats = TranslationStats(
+                calls=1, chars=len(s), contractions=len(replacements)
+            )
+            stats.times["tokenize"] = t1 - t0
+            stats.times["contractions"] = t2 - t1
+            stats.times["words"] = t3 - t2
+            stats.times["assemble"] = time.perf_counter() - t3
+            for code, count in collections.Counter(stream.types).items():
+                stats.tokens[TOKEN_TYPES[code]] += count
+            contracted = sum(
+                stream.types[pos] == WORD
+                for start, (stop, _) in replacements.items()
+                for pos in range(start, stop)
+            )
+            stats.words = stats.tokens["word"] - contracted
+            stats.elapsed = time.perf_counter() - t0
+            record_stats(stats)
+        return translated
+
+    def translate_tokens(self, tokens: Sequence[Token]) -> str:
+        return self.translate_token_stream(TokenStream.from_tokens(tokens))
+
+    def translate(self, s: str) -> str:
+        if instrumentation.get() is not None:
+            return self.translate_instrumented(s)
+        cache = self.result_cache
+        if cache.maxsize <= 0:
+            return self.translate_token_stream(TokenStream.from_text(s))
+        translated = cache.lookup(s)
+        if translated is None:
+            translated = self.translate_token_stream(TokenStream.from_text(s))
+            cache.store(s, translated)
+        return translated
+
+    def translate_aligned(self, s: str) -> Tuple[str, "Alignment"]:
+        """
+        Translate `s`, and tell which part of the output came from where.
+
+        See `Alignment`. The result cache is not used.
+        """
+        alignment = Alignment.for_text(s)
+        translated = self.translate_token_stream(
+            TokenStream.from_text(s), alignment=alignment
+        )
+        return translated, alignment
+
+    def translate_instrumented(self, s: str) -> str:
+        """
+        Translate like `translate()`, timing each stage.
+
+        The statistics are added to those of the current `instrument()`
+        block.
+        """
+        state = instrumentation.get()
+        assert state is not None
+        memory = state[2]
+        stats = TranslationStats(calls=1, chars=len(s))
+        times = stats.times
+        t0 = time.perf_counter()
+        cache = self.result_cache
+        translated = cache.lookup(s) if cache.maxsize > 0 else None
+        if translated is not None:
+            stats.result_cache_hits += 1
+        else:
+            if memory:
+                blocks = traced_blocks()
+                tracemalloc.reset_peak()
+                start = tracemalloc.get_traced_memory()[0], blocks
+            stream = TokenStream.from_text(s)
+            t1 = time.perf_counter()
+            if memory:
+                start = stats.record_memory("tokenize", start)
+            for code, count in collections.Counter(stream.types).items():
+                stats.tokens[TOKEN_TYPES[code]] += count
+            replacements = self.select_contractions(stream)
+            stats.contractions = len(replacements)
+            t2 = time.perf_counter()
+            if memory:
+                start = stats.record_memory("contractions", start)
+            # Translate every word as translate_token_stream() would, but
+            # before assembling the output, to time both separately.
+            translations: Dict[str, str] = {}
+            translate_word_cached = self.translate_word_cached
+            types = stream.types
+            pos = 0
+            token = call_stats.set(stats)
+            try:
+                while pos < len(types):
+                    if pos in replacements:
+                        pos = replacements[pos][0]
+                        continue
+                    if types[pos] == WORD:
+                        stats.words += 1
+                        lower = stream.lower(pos)
+                        translations[lower] = translate_word_cached(lower)
+                    pos += 1
+            finally:
+                call_stats.reset(token)
+            if tracing.get() is None:
+                stats.cache_hits = stats.words - stats.cache_misses
+            t3 = time.perf_counter()
+            if memory:
+                start = stats.record_memory("words", start)
+            translated = self.translate_token_stream(stream, translations, replacements)
+            t4 = time.perf_counter()
+            if memory:
+                stats.record_memory("assemble", start)
+            times["tokenize"] += t1 - t0
+            times["contractions"] += t2 - t1
+            times["words"] += t3 - t2
+            times["assemble"] += t4 - t3
+            if cache.maxsize > 0:
+                cache.store(s, translated)
+        stats.elapsed = time.perf_counter() - t0
+        record_stats(stats)
+        return translated
+
+    def find_safe_split(
+        self, tokens: typing.Union[TokenStream, Sequence[Token]]
+    ) -> int:
+        """
+        Find a position where `tokens` can be split without changing the result.
+
+        This is the start of a whitespace token that is followed by enough
+        tokens to see every contraction that could span it, and that is
+        not spanned by any contraction candidate. Returns 0 if there is no
+        such position.
+        """
+        # A contraction of n words spans 2n-1 tokens, and is followed by up
+        # to two tokens of context. The final token may still grow when
+        # more input arrives.
+        stream = as_token_stream(tokens)
+        lookahead = 2 * self.contraction_max_words + 2
+        candidates = self.find_contractions(stream)
+        spans = [
+            (start, stop)
+            for matches in candidates.values()
+            for start, stop, _ in matches
+        ]
+        for pos in range(len(stream) - lookahead, 0, -1):
+            if stream.types[pos] != WHITESPACE:
+                continue
+            if any(start < pos < stop for start, stop in spans):
+                continue
+            return pos
+        return 0
+
+    def split_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Regroup a stream of text chunks into independently translatable pieces.
+
+        Pieces end after the first character of whitespace that no
+        contraction can span, so that patterns looking ahead past the end
+        of a piece see the same text as they would in the whole input.
+        Only the tail of the input that may still be part of a contraction
+        is kept in memory.
+        """
+        stream = TokenStream.from_text("")
+        buffered: List[str] = []
+        size = 0
+        # Length of the pending text when no split was found. Looking
+        # again only once it has doubled keeps long texts without safe
+        # whitespace from taking quadratic time.
+        unsplit = 0
+        for chunk in chunks:
+            if not chunk:
+                continue
+            buffered.append(chunk)
+            size += len(chunk)
+            if size < 2 * unsplit:
+                continue
+            stream = stream.extended("".join(buffered))
+            buffered.clear()
+            pos = self.find_safe_split(stream)
+            if pos == 0:
+                unsplit = len(stream.text)
+                continue
+            split = stream.bounds[pos] + 1
+            yield stream.text[:split]
+            stream = TokenStream.from_text(stream.text[split:])
+            size = len(stream.text)
+            unsplit = 0
+        pending = stream.text + "".join(buffered)
+        if pending:
+            yield pending
+
+    def translate_stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Translate text incrementally.
+
+        This accepts any iterable of strings, such as a list of chunks or an
+        open text file, and yields translated output as soon as it is known.
+        The concatenated output is the same as translating the concatenated
+        input in one go.
+        """
+        for piece in self.split_stream(chunks):
+            yield self.translate(piece)
+
+    def translate_file(
+        self, src: typing.TextIO, dst: typing.TextIO, chunk_size: int = 64 * 1024
+    ) -> None:
+        """
+        Translate the text stream `src` and write the result to `dst`.
+        """
+        chunks = iter(lambda: src.read(chunk_size), "")
+        for translated in self.translate_stream(chunks):
+            dst.write(translated)
+
+    def split_text(self, s: str, chunk_size: Optional[int] = None) -> List[str]:
+        """
+        Split `s` into pieces of roughly `chunk_size` characters.
+
+        Pieces are split after the first character of whitespace that no
+        contraction can span, so translating the pieces separately gives
+        the same result as translating `s` as a whole. Sentence and
+        paragraph boundaries are preferred; if none occur within another
+        `chunk_size` characters, any safe whitespace is used.
+        """
+        if chunk_size is None:
+            chunk_size = PARALLEL_CHUNK_SIZE
+        stream = TokenStream.from_text(s)
+        spanned = bytearray(len(stream) + 1)
+        for matches in self.find_contractions(stream).values():
+            for start, stop, _ in matches:
+                spanned[start + 1 : stop] = b"\x01" * (stop - start - 1)
+
+        pieces = []
+        piece_start = 0  # character offset
+        for pos in range(len(stream)):
+            offset = stream.bounds[pos]
+            if (
+                offset - piece_start >= chunk_size
+                and stream.types[pos] == WHITESPACE
+                and not spanned[pos]
+                and (
+                    offset - piece_start >= 2 * chunk_size
+                    or is_sentence_boundary(stream, pos)
+                )
+            ):
+                # Keep one whitespace character, for patterns looking
+                # ahead past the end of the piece.
+                pieces.append(s[piece_start : offset + 1])
+                piece_start = offset + 1
+        pieces.append(s[piece_start:])
+        return pieces
+
+
+default_translator = Translator(word_cache=word_cache, result_cache=result_cache)
+
+
+def set_result_cache(
+    maxsize: int, maxbytes: int = 0, max_length: int = RESULT_CACHE_MAX_LENGTH
+) -> None:
+    """
+    Cache up to `maxsize` complete translations of short inputs.
+
+    This helps when the same (short) strings are translated over and over
+    again. A `maxsize` of 0 disables the cache, which is the default.
+    """
+    result_cache.max_length = max_length
+    result_cache.resize(maxsize, maxbytes)
+    if maxsize <= 0:
+        result_cache.clear()
 
 
 #
 # Main API
 #
+# These functions use the default translator.
+#
+
+
+def warmup() -> None:
+    default_translator.warmup()
+
+
+def find_contractions(
+    tokens: Sequence[Token],
+) -> typing.DefaultDict[int, List[Tuple[int, int, str]]]:
+    return default_translator.find_contractions(tokens)
+
+
+def apply_contractions(tokens: Sequence[Token]) -> List[Token]:
+    return default_translator.apply_contractions(tokens)
+
+
+def split_into_syllables(word: str) -> List[Syllable]:
+    return default_translator.split_into_syllables(word)
+
+
+def translate_words(words: Iterable[str]) -> Dict[str, str]:
+    return default_translator.translate_words(words)
+
+
+def translate_syllable(syl: Syllable) -> Tuple[str, int]:
+    return default_translator.translate_syllable(syl)
+
+
+def translate_using_syllables(word: str) -> str:
+    return default_translator.translate_using_syllables(word)
+
+
+def translate_word(word: str) -> str:
+    return default_translator.translate_word(word)
+
+
+def translate_single_word_token(token: Token) -> Token:
+    return default_translator.translate_single_word_token(token)
+
+
+def apply_single_words(tokens: Sequence[Token]) -> List[Token]:
+    return default_translator.apply_single_words(tokens)
+
+
+def translate_tokens(tokens: Sequence[Token]) -> str:
+    return default_translator.translate_tokens(tokens)
 
 
 def translate(s: str) -> str:
-    tokens = list(tokenize(s))
-    tokens = apply_contractions(tokens)
-    tokens = apply_single_words(tokens)
-    return "".join(t.value for t in tokens)
+    return default_translator.translate(s)
+
+
+def translate_aligned(s: str) -> Tuple[str, Alignment]:
+    return default_translator.translate_aligned(s)
+
+
+def translate_document(s: str, workers: int = 1, batch_size: int = 2000) -> str:
+    return default_translator.translate_document(s, workers, batch_size)
+
+
+def find_safe_split(tokens: Sequence[Token]) -> int:
+    return default_translator.find_safe_split(tokens)
+
+
+def split_stream(chunks: Iterable[str]) -> Iterator[str]:
+    return default_translator.split_stream(chunks)
+
+
+def translate_stream(chunks: Iterable[str]) -> Iterator[str]:
+    return default_translator.translate_stream(chunks)
+
+
+def translate_file(
+    src: typing.TextIO, dst: typing.TextIO, chunk_size: int = 64 * 1024
+) -> None:
+    default_translator.translate_file(src, dst, chunk_size)
+
+
+def split_text(s: str, chunk_size: Optional[int] = None) -> List[str]:
+    return default_translator.split_text(s, chunk_size)
+
+
+#
+# Incremental translation
+#
+
+# Target size of the pieces of a document that are translated again
+# after an edit.
+INCREMENTAL_CHUNK_SIZE = 512
+
+
+@attr.s(frozen=True, slots=True)
+class TextEdit:
+    """Replacement of `deleted` characters at `offset` by `inserted`."""
+
+    offset: int = attr.ib()
+    deleted: int = attr.ib()
+    inserted: str = attr.ib()
+
+
+class IncrementalTranslator:
+    """
+    Translation of a document that is edited over time.
+
+    The document is kept as pieces that can be translated independently
+    (see `split_text()`), together with their translations. An edit only
+    translates the pieces around it again; the output is always the same
+    as translating the whole document.
+    """
+
+    def __init__(
+        self,
+        text: str = "",
+        translator: Optional[Translator] = None,
+        chunk_size: int = INCREMENTAL_CHUNK_SIZE,
+    ) -> None:
+        self.translator = translator or default_translator
+        self.chunk_size = chunk_size
+        self.pieces = self.translator.split_text(text, chunk_size)
+        self.outputs = [self.translator.translate(piece) for piece in self.pieces]
+        # Edits that change tokens closer than this to a piece boundary
+        # may change how the text around it is translated.
+        self.margin = 2 * self.translator.contraction_max_words + 4
+
+    @property
+    def text(self) -> str:
+        return "".join(self.pieces)
+
+    @property
+    def output(self) -> str:
+        return "".join(self.outputs)
+
+    def edit(self, offset: int, deleted: int, inserted: str) -> TextEdit:
+        """
+        Replace `deleted` characters at `offset` by `inserted`.
+
+        Returns the corresponding change to the output.
+        """
+        starts = [0, *itertools.accumulate(map(len, self.pieces))]
+        if not 0 <= offset <= offset + deleted <= starts[-1]:
+            raise ValueError("edit outside of text")
+
+        # Find the pieces affected by the edit, and extend them with
+        # neighbouring pieces until their boundaries are far enough (in
+        # tokens) from the edit to stay safe.
+        n_pieces = len(self.pieces)
+        first = min(bisect.bisect_right(starts, offset) - 1, n_pieces - 1)
+        stop = max(first + 1, bisect.bisect_left(starts, offset + deleted))
+        while True:
+            start = starts[first]
+            text = "".join(self.pieces[first:stop])
+            region = (
+                text[: offset - start] + inserted + text[offset + deleted - start :]
+            )
+            stream = TokenStream.from_text(region)
+            bounds = stream.bounds
+            edit_start = offset - start
+            edit_stop = edit_start + len(inserted)
+            before = bisect.bisect_right(bounds, edit_start) - 1
+            after = len(stream) - bisect.bisect_left(bounds, edit_stop)
+            extend_before = first > 0 and before < self.margin
+            extend_after = stop < n_pieces and after < self.margin
+            if not (extend_before or extend_after):
+                break
+            if extend_before:
+                first -= 1
+            if extend_after:
+                stop += 1
+
+        pieces = self.translator.split_text(region, self.chunk_size)
+        outputs = [self.translator.translate(piece) for piece in pieces]
+        old = "".join(self.outputs[first:stop])
+        new = "".join(outputs)
+        output_offset = sum(map(len, self.outputs[:first]))
+        self.pieces[first:stop] = pieces
+        self.outputs[first:stop] = outputs
+
+        # Only report what actually changed.
+        prefix = 0
+        limit = min(len(old), len(new))
+        while prefix < limit and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < limit - prefix
+            and old[len(old) - suffix - 1] == new[len(new) - suffix - 1]
+        ):
+            suffix += 1
+        return TextEdit(
+            output_offset + prefix,
+            len(old) - prefix - suffix,
+            new[prefix : len(new) - suffix],
+        )
+
+
+#
+# Parallel translation
+#
+
+# Inputs smaller than this are translated in the current process, since
+# handing them to worker processes costs more than it saves.
+PARALLEL_MIN_CHARS = 64 * 1024
+
+# Target size of the pieces a large document is split into.
+PARALLEL_CHUNK_SIZE = 16 * 1024
+
+
+# Translator used by tasks in worker processes.
+worker_translator: Optional[Translator] = None
+
+
+def init_worker(translator: Optional[Translator] = None) -> None:
+    """Prepare a worker process, so that the first task is not slow."""
+    global worker_translator
+    worker_translator = translator or default_translator
+    worker_translator.warmup()
+
+
+def translate_words_in_worker(words: Iterable[str]) -> Dict[str, str]:
+    return (worker_translator or default_translator).translate_words(words)
+
+
+def translate_in_worker(s: str) -> str:
+    return (worker_translator or default_translator).translate(s)
+
+
+def batched(iterable: Iterable[T], n: int) -> Iterator[List[T]]:
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+def translate_many(
+    texts: Iterable[str],
+    workers: Optional[int] = None,
+    batch_size: int = 16,
+    executor: str = "process",
+) -> List[str]:
+    """
+    Translate many texts using a pool of worker processes or threads.
+
+    Results are in the same order as `texts`. The number of workers
+    defaults to the number of CPUs; `batch_size` is the number of texts
+    sent to a worker at once. Small workloads are translated serially.
+
+    With `executor="thread"`, all threads share the default translator,
+    which is thread-safe. This avoids starting processes, but only helps
+    on Python builds without a global interpreter lock.
+    """
+    if executor not in ("process", "thread"):
+        raise ValueError(f"invalid executor: {executor!r}")
+    texts = list(texts)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(texts) <= 1 or sum(map(len, texts)) < PARALLEL_MIN_CHARS:
+        return [translate(s) for s in texts]
+    import concurrent.futures
+
+    if executor == "thread":
+        # Each batch runs in a copy of the current context, so that an
+        # instrument() block also sees the translations in the threads.
+        contexts = iter(contextvars.copy_context, None)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            batches = pool.map(
+                translate_batch_in_context, batched(texts, batch_size), contexts
+            )
+            return [translated for batch in batches for translated in batch]
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker
+    ) as pool:
+        return list(pool.map(translate, texts, chunksize=batch_size))
+
+
+def translate_batch(texts: Sequence[str]) -> List[str]:
+    return [translate(s) for s in texts]
+
+
+def translate_batch_in_context(
+    texts: Sequence[str], context: contextvars.Context
+) -> List[str]:
+    return context.run(translate_batch, texts)
+
+
+def translate_parallel(
+    s: str,
+    workers: Optional[int] = None,
+    chunk_size: int = PARALLEL_CHUNK_SIZE,
+    executor: str = "process",
+) -> str:
+    """
+    Translate a large document using a pool of worker processes or threads.
+
+    The document is split into pieces of about `chunk_size` characters
+    using `split_text()`. The result is the same as `translate(s)`.
+    """
+    if len(s) < PARALLEL_MIN_CHARS:
+        return translate(s)
+    pieces = split_text(s, chunk_size)
+    return "".join(translate_many(pieces, workers, 1, executor))
+
+
+#
+# Command line interface
+#
+
+# Number of lines or pieces handed to worker processes at once.
+CLI_BATCH_SIZE = 1024
+
+
+def map_batched(
+    fn: typing.Callable[[str], str],
+    items: Iterable[str],
+    executor: Optional["concurrent.futures.Executor"],
+) -> Iterator[str]:
+    """Apply `fn` to `items`, using `executor` (if any) one batch at a time."""
+    if executor is None:
+        yield from map(fn, items)
+        return
+    for batch in batched(items, CLI_BATCH_SIZE):
+        yield from executor.map(fn, batch, chunksize=max(1, len(batch) // 64))
+
+
+def read_chunks(fp: typing.TextIO, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    return iter(lambda: fp.read(chunk_size), "")
+
+
+def open_input(filename: str) -> typing.ContextManager[typing.TextIO]:
+    # Standard input stays open, so that it can be read again.
+    if filename == "-":
+        return contextlib.nullcontext(sys.stdin)
+    return open(filename, encoding="utf-8")
+
+
+def translate_line(line: str) -> str:
+    body = line.rstrip("\r\n")
+    return translate_in_worker(body) + line[len(body) :]
+
+
+def translate_json_line(line: str, fields: Sequence[str]) -> str:
+    """
+    Translate the string `fields` of a JSON object on a single line.
+
+    Other JSON values are passed through unchanged.
+    """
+    if not line.strip():
+        return line
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        return line
+    for field in fields:
+        value = obj.get(field)
+        if isinstance(value, str):
+            obj[field] = translate_in_worker(value)
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+
+def json_line_texts(line: str, fields: Sequence[str]) -> List[str]:
+    """Return the strings that `translate_json_line()` translates."""
+    if not line.strip():
+        return []
+    obj = json.loads(line)
+    if not isinstance(obj, dict):
+        return []
+    return [obj[field] for field in fields if isinstance(obj.get(field), str)]
+
+
+def line_texts(line: str) -> List[str]:
+    return [line.rstrip("\r\n")]
+
+
+@attr.s(slots=True)
+class ThroughputStats:
+    chars: int = attr.ib(default=0)
+    tokens: int = attr.ib(default=0)
+    started: float = attr.ib(factory=time.perf_counter)
+
+    def count(
+        self,
+        items: Iterable[str],
+        texts: Optional[typing.Callable[[str], Iterable[str]]] = None,
+    ) -> Iterator[str]:
+        """
+        Pass through `items`, counting input characters and tokens.
+
+        Only the text that is translated counts: `texts(item)` if given,
+        and the item itself otherwise.
+        """
+        for item in items:
+            for text in texts(item) if texts is not None else [item]:
+                self.chars += len(text)
+                self.tokens += len(TokenStream.from_text(text))
+            yield item
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        template = "{} chars, {} tokens in {:.3f}s ({:.0f} chars/s, {:.0f} tokens/s)"
+        return template.format(
+            self.chars,
+            self.tokens,
+            elapsed,
+            self.chars / elapsed,
+            self.tokens / elapsed,
+        )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="haags", description="Translate Dutch text into Haags."
+    )
+    parser.add_argument(
+        "files", nargs="*", metavar="FILE", help="input files (default: stdin)"
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--lines", action="store_true", help="translate each line separately"
+    )
+    mode.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="read JSON lines and translate the selected fields",
+    )
+    parser.add_argument(
+        "--field",
+        action="append",
+        dest="fields",
+        metavar="NAME",
+        help="JSON field to translate; may be repeated (default: text)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="number of worker processes (default: 1, 0: number of CPUs)",
+    )
+    parser.add_argument(
+        "--hyphenation-cache",
+        metavar="PATH",
+        help="persistent hyphenation cache file, shared between runs",
+    )
+    parser.add_argument(
+        "--lexicon",
+        metavar="PATH",
+        help="precompiled lexicon to use (see --build-lexicon)",
+    )
+    parser.add_argument(
+        "--build-lexicon",
+        metavar="PATH",
+        help="translate all words in the input ahead of time, and write a "
+        "lexicon file instead of output",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print throughput statistics to stderr",
+    )
+    args = parser.parse_args(argv)
+    fields = args.fields or ["text"]
+    jobs = args.jobs or os.cpu_count() or 1
+
+    if args.hyphenation_cache:
+        set_hyphenation_cache(args.hyphenation_cache)
+
+    if args.build_lexicon:
+        words: typing.Set[str] = set()
+        for filename in args.files or ["-"]:
+            with open_input(filename) as fp:
+                for text in split_stream(read_chunks(fp)):
+                    stream = TokenStream.from_text(text)
+                    words.update(
+                        stream.lower(i)
+                        for i in range(len(stream))
+                        if stream.types[i] == WORD
+                    )
+        default_translator.compile_lexicon(words, args.build_lexicon)
+        return 0
+
+    # Tasks use the worker translator, both in this process and in
+    # worker processes.
+    global worker_translator
+    previous_translator = worker_translator
+    worker_translator = default_translator
+    if args.lexicon:
+        worker_translator = attr.evolve(
+            default_translator, lexicon=Lexicon(args.lexicon)
+        )
+
+    fn: typing.Callable[[str], str]
+    texts: Optional[typing.Callable[[str], List[str]]] = None
+    if args.jsonl:
+        fn = functools.partial(translate_json_line, fields=fields)
+        texts = functools.partial(json_line_texts, fields=fields)
+    elif args.lines:
+        fn = translate_line
+        texts = line_texts
+    else:
+        fn = translate_in_worker
+
+    executor = None
+    if jobs > 1:
+        import concurrent.futures
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=init_worker,
+            initargs=(worker_translator,),
+        )
+    stats = ThroughputStats() if args.stats else None
+    out = sys.stdout
+    try:
+        for filename in args.files or ["-"]:
+            with open_input(filename) as fp:
+                if args.jsonl or args.lines:
+                    items: Iterable[str] = fp
+                else:
+                    items = split_stream(read_chunks(fp))
+                if stats is not None:
+                    items = stats.count(items, texts)
+                for translated in map_batched(fn, items, executor):
+                    out.write(translated)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        worker_translator = previous_translator
+    out.flush()
+    if stats is not None:
+        print(stats.summary(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+"""
+Translation server.
+
+Keeps a warmed up translator around, and translates requests in small
+batches on a thread or process pool, so that the event loop is never
+blocked. Requests are accepted as JSON-RPC on stdin/stdout, or as HTTP
+on a TCP or unix socket.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import json
+import sys
+import time
+import typing
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import attr
+
+import haags
+
+SERVER_MAX_BATCH_SIZE = 64
+SERVER_MAX_DELAY = 0.002  # seconds
+SERVER_MAX_QUEUE = 1024
+SERVER_LATENCY_SAMPLES = 10000
+HTTP_MAX_BODY = 16 * 1024 * 1024
+
+# JSON-RPC error codes.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+def translate_batch(
+    texts: Sequence[str], translator: Optional[haags.Translator] = None
+) -> List[str]:
+    # Runs in a worker thread, or in a worker process that has its own
+    # translator.
+    if translator is None:
+        return [haags.translate_in_worker(text) for text in texts]
+    return [translator.translate(text) for text in texts]
+
+
+def percentile(samples: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of sorted `samples`."""
+    if not samples:
+        return 0.0
+    index = max(0, min(len(samples) - 1, round(p / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+@attr.s(slots=True)
+class ServerStats:
+    requests: int = attr.ib(default=0)
+    batches: int = attr.ib(default=0)
+    max_queue_depth: int = attr.ib(default=0)
+    latencies: typing.Deque[float] = attr.ib(
+        factory=lambda: collections.deque(maxlen=SERVER_LATENCY_SAMPLES),
+        repr=False,
+    )
+
+    def summary(self, queue_depth: int) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0,
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "latency_ms": {
+                "p50": percentile(latencies, 50) * 1000,
+                "p90": percentile(latencies, 90) * 1000,
+                "p99": percentile(latencies, 99) * 1000,
+                "max": (latencies[-1] if latencies else 0.0) * 1000,
+            },
+        }
+
+
+@attr.s(slots=True, eq=False)
+class Server:
+    """
+    Batching translation server.
+
+    Concurrent requests are collected into batches of up to
+    `max_batch_size` texts, waiting at most `max_delay` seconds for a
+    batch to fill up. At most `max_queue` requests wait at any time;
+    `translate()` blocks when the queue is full.
+    """
+
+    translator: haags.Translator = attr.ib(factory=lambda: haags.default_translator)
+    workers: int = attr.ib(default=1)
+    executor_type: str = attr.ib(
+        default="thread", validator=attr.validators.in_(["thread", "process"])
+    )
+    max_batch_size: int = attr.ib(default=SERVER_MAX_BATCH_SIZE)
+    max_delay: float = attr.ib(default=SERVER_MAX_DELAY)
+    max_queue: int = attr.ib(default=SERVER_MAX_QUEUE)
+    stats: ServerStats = attr.ib(factory=ServerStats, init=False)
+    queue: "Optional[asyncio.Queue[Tuple[str, asyncio.Future[str]]]]" = attr.ib(
+        default=None, init=False, repr=False
+    )
+    executor: Optional[concurrent.futures.Executor] = attr.ib(
+        default=None, init=False, repr=False
+    )
+    tasks: List["asyncio.Task[None]"] = attr.ib(factory=list, init=False, repr=False)
+
+    async def start(self) -> None:
+        if self.executor_type == "process":
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=haags.init_worker,
+                initargs=(self.translator,),
+            )
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers
+            )
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.tasks = [
+            asyncio.ensure_future(self.process_batches()) for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    async def __aenter__(self) -> "Server":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+    async def translate(self, text: str) -> str:
+        assert self.queue is not None, "server not started"
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self.queue.put((text, future))
+        self.stats.max_queue_depth = max(
+            self.stats.max_queue_depth, self.queue.qsize()
+        )
+        translated = await future
+        self.stats.latencies.append(time.perf_counter() - start)
+        return translated
+
+    async def next_batch(self) -> List[Tuple[str, "asyncio.Future[str]"]]:
+        assert self.queue is not None
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def process_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        # Worker processes have their own copy of the translator.
+        translator = None if self.executor_type == "process" else self.translator
+        while True:
+            batch = await self.next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, translate_batch, texts, translator
+                )
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.stats.requests += len(batch)
+            self.stats.batches += 1
+            for (_, future), translated in zip(batch, results):
+                if not future.done():
+                    future.set_result(translated)
+
+    def summary(self) -> Dict[str, Any]:
+        return self.stats.summary(self.queue.qsize() if self.queue else 0)
+
+    #
+    # JSON-RPC
+    #
+
+    async def handle_rpc(self, request: Any) -> Optional[Dict[str, Any]]:
+        """
+        Handle a JSON-RPC 2.0 request, and return the response.
+
+        Supported methods are ``translate`` (with a ``text`` parameter) and
+        ``stats``. Notifications (requests without an id) get no response.
+        """
+        if not isinstance(request, dict) or not isinstance(
+            request.get("method"), str
+        ):
+            return rpc_error(None, INVALID_REQUEST, "invalid request")
+        request_id = request.get("id")
+        method = request["method"]
+        params = request.get("params", {})
+        if method == "translate":
+            if isinstance(params, list) and len(params) == 1:
+                text = params[0]
+            elif isinstance(params, dict):
+                text = params.get("text")
+            else:
+                text = None
+            if not isinstance(text, str):
+                response = rpc_error(request_id, INVALID_PARAMS, "text required")
+            else:
+                try:
+                    result = await self.translate(text)
+                except Exception:
+                    response = rpc_error(request_id, INTERNAL_ERROR, "internal error")
+                else:
+                    response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        elif method == "stats":
+            response = {"jsonrpc": "2.0", "id": request_id, "result": self.summary()}
+        else:
+            response = rpc_error(request_id, METHOD_NOT_FOUND, "method not found")
+        if "id" not in request:
+            return None
+        return response
+
+    async def serve_stdio(
+        self,
+        input: Optional[typing.TextIO] = None,
+        output: Optional[typing.TextIO] = None,
+    ) -> None:
+        """
+        Serve JSON-RPC requests, one per line, until the input ends.
+
+        Responses are written as soon as they are ready, which may be out
+        of order.
+        """
+        input = input or sys.stdin
+        output = output or sys.stdout
+        loop = asyncio.get_running_loop()
+        # Limits the number of requests in flight, so that reading stops
+        # when the server cannot keep up.
+        in_flight = asyncio.Semaphore(self.max_queue)
+        pending = set()
+
+        async def respond(line: str) -> None:
+            response: Optional[Dict[str, Any]]
+            try:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = rpc_error(None, PARSE_ERROR, "parse error")
+                else:
+                    response = await self.handle_rpc(request)
+                if response is not None:
+                    output.write(json.dumps(response, ensure_ascii=False) + "\n")
+                    output.flush()
+            finally:
+                in_flight.release()
+
+        while True:
+            line = await loop.run_in_executor(None, input.readline)
+            if not line:
+                break
+            if not line.strip():
+                continue
+            await in_flight.acquire()
+            task = asyncio.ensure_future(respond(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+    #
+    # HTTP
+    #
+
+    async def handle_http(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Handle HTTP/1.1 requests on a single connection.
+
+        ``POST /translate`` takes a JSON object with a ``text`` field, and
+        returns one with the translated ``text``. ``POST /rpc`` takes a
+        JSON-RPC request. ``GET /stats`` returns statistics.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await send_http(writer, 400, {"error": "bad request"}, False)
+                    break
+                headers = {}
+                while True:
+                    header_line = await reader.readline()
+                    if header_line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header_line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                try:
+                    length = int(headers.get("content-length", "0"))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= HTTP_MAX_BODY:
+                    await send_http(writer, 400, {"error": "bad length"}, False)
+                    break
+                body = await reader.readexactly(length)
+                try:
+                    status, response = await self.handle_http_request(
+                        method, path, body
+                    )
+                except Exception:
+                    status, response = 500, {"error": "internal error"}
+                await send_http(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_http_request(
+        self, method: str, path: str, body: bytes
+    ) -> Tuple[int, Any]:
+        if path == "/stats" and method == "GET":
+            return 200, self.summary()
+        if path not in ("/translate", "/rpc"):
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 405, {"error": "method not allowed"}
+        try:
+            request = json.loads(body.decode("utf-8"))
+        except ValueError:
+            if path == "/rpc":
+                return 200, rpc_error(None, PARSE_ERROR, "parse error")
+            return 400, {"error": "invalid json"}
+        if path == "/rpc":
+            return 200, await self.handle_rpc(request)
+        text = request.get("text") if isinstance(request, dict) else None
+        if not isinstance(text, str):
+            return 400, {"error": "text required"}
+        return 200, {"text": await self.translate(text)}
+
+    async def serve_http(
+        self, host: str = "127.0.0.1", port: int = 0, path: Optional[str] = None
+    ) -> asyncio.base_events.Server:
+        """Start accepting HTTP connections on a TCP or unix socket."""
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle_http, path)
+        return await asyncio.start_server(self.handle_http, host, port)
+
+
+def rpc_error(request_id: Any, code: int, message: str) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": code, "message": message},
+    }
+
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+async def send_http(
+    writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool
+) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        f"\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+async def serve(server: Server, args: Any) -> None:
+    async with server:
+        if args.http is None and args.unix is None:
+            await server.serve_stdio()
+            return
+        if args.unix is not None:
+            listener = await server.serve_http(path=args.unix)
+        else:
+            host, _, port = args.http.rpartition(":")
+            listener = await server.serve_http(host or "127.0.0.1", int(port))
+        async with listener:
+            await listener.serve_forever()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="haags-server",
+        description="Translate Dutch text into Haags, as a service. Without "
+        "--http or --unix, JSON-RPC requests are read from stdin.",
+    )
+    listen = parser.add_mutually_exclusive_group()
+    listen.add_argument("--http", metavar="[HOST:]PORT", help="serve HTTP over TCP")
+    listen.add_argument("--unix", metavar="PATH", help="serve HTTP on a unix socket")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="number of workers (default: 1)",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="use worker processes instead of threads",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=SERVER_MAX_BATCH_SIZE,
+        metavar="N",
+        help=f"maximum batch size (default: {SERVER_MAX_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=SERVER_MAX_QUEUE,
+        metavar="N",
+        help=f"maximum number of waiting requests (default: {SERVER_MAX_QUEUE})",
+    )
+    parser.add_argument(
+        "--lexicon",
+        metavar="PATH",
+        help="precompiled lexicon to use",
+    )
+    args = parser.parse_args(argv)
+
+    translator = haags.default_translator
+    if args.lexicon:
+        translator = attr.evolve(translator, lexicon=haags.Lexicon(args.lexicon))
+    translator.warmup()
+    server = Server(
+        translator=translator,
+        workers=max(1, args.jobs),
+        executor_type="process" if args.processes else "thread",
+        max_batch_size=args.batch_size,
+        max_queue=args.max_queue,
+    )
+    try:
+        asyncio.run(serve(server, args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
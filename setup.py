@@ -6,6 +6,12 @@ setup(
     author="Wouter Bolsterlee",
     author_email="wouter@bolsterl.ee",
     install_requires=["attrs", "pyphen"],
-    py_modules=["haags"],
+    py_modules=["haags", "haags_server"],
+    entry_points={
+        "console_scripts": [
+            "haags = haags:main",
+            "haags-server = haags_server:main",
+        ]
+    },
     license="BSD",
 )
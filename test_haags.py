@@ -2,10 +2,20 @@
 Test module.
 """
 
+import io
+import json
+import os
+import pathlib
+import pickle
+import random
+import re
+import subprocess
+import sys
 import typing
 from pprint import pprint
 from typing import List, Tuple
 
+import attr
 import pytest
 
 import haags
@@ -54,6 +64,35 @@ def test_tokenize() -> None:
     )
     pprint(list(haags.tokenize(input)))
 
+    # Runs of unknown input become a single token, also at the end.
+    input = "ok 😀😀 #"
+    tokens = list(haags.tokenize(input))
+    assert "".join(t.value for t in tokens) == input
+    types = ["word", "whitespace", "other", "whitespace", "other"]
+    assert [t.type for t in tokens] == types
+    assert tokens[2].value == "😀😀"
+
+
+def test_token_stream() -> None:
+    input = "Ken je 3 IJsland-fans? 😀"
+    stream = haags.TokenStream.from_text(input)
+    assert len(stream) == 10
+    assert stream.value(0) == "Ken"
+    assert stream.lower(0) == "ken"
+    assert stream.type(4) == "number"
+    assert stream.type(9) == "other"
+    assert list(stream.tokens()) == list(haags.tokenize(input))
+    roundtrip = haags.TokenStream.from_tokens(stream.tokens())
+    assert roundtrip.text == input
+    assert roundtrip.types == stream.types
+    assert roundtrip.bounds == stream.bounds
+    assert roundtrip.bounds.typecode == stream.bounds.typecode
+
+    token = haags.Token("IJsland", "word")
+    assert token.value_lower == "ijsland"
+    assert token.case == "sentence"
+    assert haags.Token(" ", "whitespace").case is None
+
 
 def test_contraction() -> None:
     input = """
@@ -74,6 +113,745 @@ def test_contraction() -> None:
     assert translated == expected
 
 
+def test_contraction_priority() -> None:
+    # Longer contractions win, even when a shorter one starts earlier.
+    assert haags.translate("dat ik dacht het niet") == "dat ik dachutnie"
+    assert haags.translate("Dat ik, van jou") == "Dattik, vajjâh"
+    # Contractions must be followed by whitespace or punctuation+whitespace.
+    assert haags.translate("van jou!") == "vajjâh!"
+    assert haags.translate("van jou!x") == "van jâh!x"
+
+
+def test_word_cache() -> None:
+    cache = haags.word_cache
+    maxsize = cache.maxsize
+    try:
+        cache.clear()
+        assert haags.translate("Kijk kijk KIJK") == "Kèk kèk KÈK"
+        info = cache.info()
+        assert (info.hits, info.misses, info.currsize) == (2, 1, 1)
+
+        cache.resize(2)
+        haags.translate("een twee drie vier")
+        info = cache.info()
+        assert info.currsize == 2
+        assert info.evictions == 3  # kijk, een, twee
+        assert list(cache.data) == ["drie", "vier"]
+
+        cache.resize(0)
+        assert cache.info().currsize == 0
+        haags.translate("kijk")
+        assert cache.info().currsize == 0
+    finally:
+        cache.resize(maxsize)
+        cache.clear()
+
+
+def test_result_cache() -> None:
+    cache = haags.result_cache
+    assert cache.maxsize == 0  # opt-in
+    haags.translate("kijk")
+    assert cache.info().misses == 0
+
+    haags.set_result_cache(2, max_length=20)
+    try:
+        assert haags.translate("Ken je hem?") == "Kejjenem?"
+        assert haags.translate("Ken je hem?") == "Kejjenem?"
+        assert haags.translate("KEN JE HEM?") == "KEJJENEM?"
+        info = cache.info()
+        assert (info.hits, info.misses, info.currsize) == (1, 2, 2)
+        assert info.currbytes > 0
+
+        long = "kijk " * 10
+        assert haags.translate(long) == "kèk " * 10
+        assert cache.info().skipped == 1
+
+        haags.translate("een")
+        assert cache.info().evictions == 1
+
+        haags.set_result_cache(10, maxbytes=1)
+        assert cache.info().currsize == 0
+        haags.translate("twee")
+        assert cache.info().currsize == 0
+    finally:
+        haags.set_result_cache(0)
+    assert cache.info() == haags.CacheInfo(0, 0, 0, 0, 0)
+
+
+def test_instrument(monkeypatch: pytest.MonkeyPatch) -> None:
+    text = "Ken je hem? Kijk kijk, 3 keer. 😀"
+    expected = haags.translate(text)
+    calls: List[haags.TranslationStats] = []
+    translator = haags.Translator()
+    with haags.instrument(calls.append) as total:
+        assert translator.translate(text) == expected
+        assert translator.translate("kijk") == "kèk"
+    assert translator.translate("kijk") == "kèk"
+    assert len(calls) == total.calls == 2
+
+    stats = calls[0]
+    assert stats.chars == len(text)
+    assert stats.contractions == 1
+    assert stats.words == 3  # kijk kijk keer
+    assert (stats.cache_hits, stats.cache_misses) == (1, 2)
+    assert stats.tokens["word"] == 6
+    assert stats.tokens["number"] == 1
+    assert stats.tokens["other"] == 1
+    assert all(seconds >= 0 for seconds in stats.times.values())
+    assert stats.times["words"] >= stats.times["syllables"] > 0
+    assert total.words == 4
+    assert total.cache_hits == 2
+    assert total.elapsed >= stats.elapsed
+
+    # Hits and misses are those of the word cache.
+    uncached = haags.Translator(word_cache=haags.LRUCache(0))
+    with haags.instrument() as total:
+        uncached.translate("kijk kijk kijk")
+    assert (total.cache_hits, total.cache_misses) == (0, 3)
+    assert total.times["hyphenation"] > 0
+
+    # Batch functions.
+    calls.clear()
+    with haags.instrument(calls.append) as total:
+        assert translator.translate_document(text) == expected
+    assert len(calls) == total.calls == 1
+    assert (total.chars, total.contractions, total.words) == (len(text), 1, 3)
+    assert total.tokens == stats.tokens
+    assert total.times["words"] > 0
+
+    monkeypatch.setattr(haags, "PARALLEL_MIN_CHARS", 0)
+    with haags.instrument() as total:
+        haags.translate_many([text] * 10, workers=2, batch_size=2, executor="thread")
+    assert (total.calls, total.words) == (10, 30)
+
+
+def test_trace_rules() -> None:
+    translator = haags.Translator().extended(
+        words={"lekker": "lekkâh"}, syllables={"flat": "flet"}
+    )
+    translator.translate("kijk")  # cached words are traced too
+    with haags.trace_rules() as trace:
+        translated = translator.translate("Lekker kijk, kijk flat!")
+    assert translated == "Lekkâh kèk, kèk flet!"
+    assert trace.fired["WORDS"] == 1
+    assert trace.fired["SYLLABLES"] == 1
+    assert trace.fired["ei_ij"] == 2
+    assert trace.checked["ei_ij"] == 2
+    assert trace.fallthrough == {"kijk": 2, "flat": 1}
+
+    summary = trace.summary(n=1)
+    assert summary["hottest"] == [("ei_ij", 2)]
+    assert "ens" in summary["never_fired"]
+    assert "ei_ij" not in summary["never_fired"]
+    assert json.loads(json.dumps(summary))
+
+    translator.translate("ens")
+    assert trace.fired["ens"] == 0
+
+    # Other translation paths count the same.
+    text = "Lekker kijk, kijk flat!"
+    with haags.trace_rules() as document_trace:
+        assert translator.translate_document(text) == translated
+    with haags.trace_rules() as instrumented_trace, haags.instrument():
+        assert translator.translate(text) == translated
+    for other in [document_trace, instrumented_trace]:
+        assert other.fired == trace.fired
+        assert other.fallthrough == trace.fallthrough
+
+
+def test_translate_stream() -> None:
+    with open("samples.txt") as fp:
+        text = fp.read()
+    text += " ken je hem\nik dacht het niet. Van jou!"
+    expected = haags.translate(text)
+
+    rng = random.Random(42)
+    for _ in range(20):
+        chunks = []
+        pos = 0
+        while pos < len(text):
+            size = rng.randint(1, 50)
+            chunks.append(text[pos : pos + size])
+            pos += size
+        assert "".join(haags.translate_stream(chunks)) == expected
+
+    # Contractions spanning chunk boundaries.
+    chunks = ["Ken j", "e h", "em", " ", "niet?"]
+    assert "".join(haags.translate_stream(chunks)) == "Kejjenem niet?"
+
+    # Tokens looking ahead past a chunk boundary.
+    s = "Dat is 5é \nmooi " * 3
+    chunks = [s[:9], s[9:]]
+    assert "".join(haags.translate_stream(chunks)) == haags.translate(s)
+
+    src = io.StringIO(text)
+    dst = io.StringIO()
+    haags.translate_file(src, dst, chunk_size=100)
+    assert dst.getvalue() == expected
+
+
+def test_split_text() -> None:
+    with open("samples.txt") as fp:
+        text = fp.read()
+    text = text.replace("\n", " ") + " ken je hem"
+    pieces = haags.split_text(text, chunk_size=10)
+    assert len(pieces) > 100
+    assert "".join(pieces) == text
+    assert "".join(haags.translate(p) for p in pieces) == haags.translate(text)
+
+    s = "Dat is 5é \nmooi " * 3
+    pieces = haags.split_text(s, chunk_size=1)
+    assert "".join(haags.translate(p) for p in pieces) == haags.translate(s)
+
+
+def test_translate_aligned() -> None:
+    translated, alignment = haags.translate_aligned("Ken je hem? Kijk!")
+    assert translated == "Kejjenem? Kèk!"
+    assert list(alignment.source) == [0, 10, 11, 12, 16, 17]
+    assert list(alignment.target) == [0, 8, 9, 10, 13, 14]
+    assert alignment.source_span(0) == (0, 10)  # contraction
+    assert alignment.target_span(0) == (0, 8)
+    assert alignment.to_target(12, 16) == (10, 13)
+    assert alignment.to_target(5, 6) == (0, 8)
+
+    with open("samples.txt") as fp:
+        text = fp.read()
+    translated, alignment = haags.translate_aligned(text)
+    assert translated == haags.translate(text)
+    assert (alignment.source[-1], alignment.target[-1]) == (len(text), len(translated))
+    for i in range(len(alignment)):
+        start, stop = alignment.source_span(i)
+        source = text[start:stop]
+        start, stop = alignment.target_span(i)
+        if " " not in source:
+            assert translated[start:stop] == haags.translate(source)
+
+    assert haags.translate_aligned("")[1].to_target(0, 0) == (0, 0)
+
+
+def test_incremental() -> None:
+    inc = haags.IncrementalTranslator()
+    assert inc.edit(0, 0, "Ken je hem") == haags.TextEdit(0, 0, "Kejjenem")
+    assert inc.edit(3, 0, "t") == haags.TextEdit(2, 4, "nt je h")  # Kent je hem
+    assert inc.edit(3, 1, "") == haags.TextEdit(2, 7, "jjen")
+    assert inc.edit(8, 2, "et") == haags.TextEdit(5, 3, " 't")
+    assert inc.output == haags.translate(inc.text) == "Kejje 't"
+    with pytest.raises(ValueError):
+        inc.edit(5, 100, "")
+
+    s = "Dat is 5é \nmooi " * 3
+    assert haags.IncrementalTranslator(s, chunk_size=1).output == haags.translate(s)
+
+    rng = random.Random(1)
+    with open("samples.txt") as fp:
+        text = fp.read()
+    words = text.split() + list(haags.ALL_CONTRACTIONS)
+    inc = haags.IncrementalTranslator(text, chunk_size=50)
+    output = inc.output
+    assert output == haags.translate(text)
+    for _ in range(200):
+        offset = rng.randint(0, len(text))
+        deleted = min(rng.choice([0, 1, 5, 20]), len(text) - offset)
+        inserted = rng.choice(
+            ["", " ", "x", "5", "\n", "12,5", " " + rng.choice(words) + " "]
+        )
+        edit = inc.edit(offset, deleted, inserted)
+        text = text[:offset] + inserted + text[offset + deleted :]
+        expected = haags.translate(text)
+        assert inc.text == text
+        assert inc.output == expected
+        stop = edit.offset + edit.deleted
+        assert output[: edit.offset] + edit.inserted + output[stop:] == expected
+        output = expected
+
+
+def test_parallel(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(haags, "PARALLEL_MIN_CHARS", 0)
+    with open("samples.txt") as fp:
+        text = fp.read()
+    texts = text.splitlines()
+    expected = [haags.translate(s) for s in texts]
+    assert haags.translate_many(texts, workers=2) == expected
+    assert haags.translate_many(texts, workers=1) == expected
+    actual = haags.translate_parallel(text, workers=2, chunk_size=1000)
+    assert actual == haags.translate(text)
+    actual = haags.translate_parallel(text, 2, 1000, executor="thread")
+    assert actual == haags.translate(text)
+    assert haags.translate_many(texts, workers=2, executor="thread") == expected
+    with pytest.raises(ValueError):
+        haags.translate_many(texts, executor="fibers")
+
+
+def test_pickle_translator() -> None:
+    import concurrent.futures
+    import multiprocessing
+
+    translator = haags.default_translator.extended(words={"kaas": "kaos"})
+    copy = pickle.loads(pickle.dumps(translator))
+    assert copy.translate("Kaas en hem") == translator.translate("Kaas en hem")
+    assert copy.words == translator.words
+
+    # Worker processes that do not fork receive a pickled translator.
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=haags.init_worker,
+        initargs=(translator,),
+    ) as pool:
+        result = pool.submit(haags.translate_words_in_worker, ["kaas", "hem"])
+        assert result.result() == translator.translate_words(["kaas", "hem"])
+
+
+def test_thread_safety() -> None:
+    import concurrent.futures
+
+    with open("samples.txt") as fp:
+        texts = fp.read().splitlines() * 5
+    random.Random(1).shuffle(texts)
+    expected = [haags.translate(s) for s in texts]
+
+    # Small caches cause many concurrent evictions.
+    translator = haags.Translator(
+        word_cache=haags.LRUCache(maxsize=50),
+        result_cache=haags.ResultCache(maxsize=20),
+    )
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+            actual = list(executor.map(translator.translate, texts))
+    finally:
+        sys.setswitchinterval(interval)
+    assert actual == expected
+    assert translator.word_cache.info().currsize <= 50
+    assert translator.result_cache.info().currsize <= 20
+
+
+def test_cli(
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+    tmp_path: pathlib.Path,
+) -> None:
+    monkeypatch.setattr("sys.stdin", io.StringIO("Ken je hem?\nik dacht het niet\n"))
+    assert haags.main([]) == 0
+    assert capsys.readouterr().out == "Kejjenem?\nik dachutnie\n"
+
+    path = tmp_path / "input.txt"
+    path.write_text("kijk\nvan jou\n", encoding="utf-8")
+    monkeypatch.setattr("sys.stdin", io.StringIO("kijk "))
+    assert haags.main(["-", str(path), "-"]) == 0
+    assert capsys.readouterr().out == "kèk kèk\nvajjâh\n"
+    assert not sys.stdin.closed
+
+    assert haags.main(["--lines", "--stats", str(path)]) == 0
+    captured = capsys.readouterr()
+    assert captured.out == "kèk\nvajjâh\n"
+    assert "tokens/s" in captured.err
+
+    path = tmp_path / "input.jsonl"
+    records = [{"text": "kijk", "title": "van jou", "id": 1}] * 3
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+    args = ["--jsonl", "--field", "title", "--jobs", "2", "--stats", str(path)]
+    assert haags.main(args) == 0
+    captured = capsys.readouterr()
+    lines = captured.out.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"text": "kijk", "title": "vajjâh", "id": 1}
+    ] * 3
+    assert captured.err.startswith("21 chars, 9 tokens")
+
+    # Values other than objects are passed through.
+    path.write_text('[1, 2]\n"kijk"\n{"text": "kijk"}\n')
+    assert haags.main(["--jsonl", "--stats", str(path)]) == 0
+    captured = capsys.readouterr()
+    assert captured.out == '[1, 2]\n"kijk"\n{"text": "kèk"}\n'
+    assert captured.err.startswith("4 chars, 1 tokens")
+
+
+def test_server(tmp_path: pathlib.Path) -> None:
+    import asyncio
+
+    import haags_server
+
+    async def http(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        method: str,
+        path: str,
+        payload: typing.Any = None,
+    ) -> typing.Tuple[int, typing.Any]:
+        body = json.dumps(payload).encode() if payload is not None else b""
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode().partition(":")
+            headers[name.lower()] = value.strip()
+        body = await reader.readexactly(int(headers["content-length"]))
+        return status, json.loads(body)
+
+    async def run(executor_type: str) -> None:
+        server = haags_server.Server(
+            workers=2, executor_type=executor_type, max_batch_size=8, max_queue=4
+        )
+        async with server:
+            texts = ["Ken je hem?", "kijk", "van jou"] * 10
+            results = await asyncio.gather(*map(server.translate, texts))
+            assert results == [haags.translate(text) for text in texts]
+            stats = server.summary()
+            assert stats["requests"] == 30
+            assert stats["batches"] < 30
+            assert stats["max_queue_depth"] <= 4
+            assert stats["latency_ms"]["p50"] <= stats["latency_ms"]["p99"]
+
+            for listener in [
+                await server.serve_http(),
+                await server.serve_http(path=str(tmp_path / "haags.sock")),
+            ]:
+                address = listener.sockets[0].getsockname()
+                if isinstance(address, str):
+                    connection = asyncio.open_unix_connection(address)
+                else:
+                    connection = asyncio.open_connection(*address[:2])
+                reader, writer = await connection
+                assert await http(
+                    reader, writer, "POST", "/translate", {"text": "kijk"}
+                ) == (200, {"text": "kèk"})
+                request = {"jsonrpc": "2.0", "id": 3, "method": "translate"}
+                assert await http(
+                    reader, writer, "POST", "/rpc", {**request, "params": ["kijk"]}
+                ) == (200, {"jsonrpc": "2.0", "id": 3, "result": "kèk"})
+                status, _ = await http(reader, writer, "POST", "/translate", {})
+                assert status == 400
+                status, stats = await http(reader, writer, "GET", "/stats")
+                assert status == 200 and stats["requests"] >= 31
+                writer.close()
+                listener.close()
+                await listener.wait_closed()
+
+            requests = [
+                {"jsonrpc": "2.0", "id": 1, "method": "translate", "params": {}},
+                {"jsonrpc": "2.0", "id": 2, "method": "nope"},
+                {"jsonrpc": "2.0", "method": "translate", "params": ["kijk"]},
+                {"jsonrpc": "2.0", "id": 4, "method": "translate", "params": ["kijk"]},
+            ]
+            input = io.StringIO("".join(json.dumps(r) + "\n" for r in requests))
+            output = io.StringIO()
+            await server.serve_stdio(input, output)
+            responses = [json.loads(line) for line in output.getvalue().splitlines()]
+            responses.sort(key=lambda response: response["id"])
+            assert [r.get("error", {}).get("code") for r in responses] == [
+                haags_server.INVALID_PARAMS,
+                haags_server.METHOD_NOT_FOUND,
+                None,
+            ]
+            assert responses[2]["result"] == "kèk"
+
+    asyncio.run(run("thread"))
+    asyncio.run(run("process"))
+
+    class BrokenTranslator(haags.Translator):
+        def translate(self, s: str) -> str:
+            raise RuntimeError("broken")
+
+    async def run_broken() -> None:
+        server = haags_server.Server(translator=BrokenTranslator())
+        async with server:
+            request = {"jsonrpc": "2.0", "id": 1, "method": "translate"}
+            input = io.StringIO(json.dumps({**request, "params": ["kijk"]}) + "\n")
+            output = io.StringIO()
+            await server.serve_stdio(input, output)
+            response = json.loads(output.getvalue())
+            assert response["error"]["code"] == haags_server.INTERNAL_ERROR
+
+            listener = await server.serve_http()
+            reader, writer = await asyncio.open_connection(
+                *listener.sockets[0].getsockname()[:2]
+            )
+            status, _ = await http(reader, writer, "POST", "/translate", {"text": "a"})
+            assert status == 500
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+
+    asyncio.run(run_broken())
+
+
+def test_bench(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    import bench_haags
+
+    for name in bench_haags.CORPORA:
+        text = bench_haags.generate(name, 500)
+        assert len(text) == 500
+        assert text == bench_haags.generate(name, 500)
+
+    output = str(tmp_path / "bench.json")
+    args = ["--size", "200", "--repeat", "1", "--import-repeat", "0"]
+    assert bench_haags.main(args + ["--corpus", "junk", "--output", output]) == 0
+    with open(output) as fp:
+        report = json.load(fp)
+    assert "translate/junk/200" in report["results"]
+    args += ["--corpus", "junk", "--baseline", output, "--threshold", "1000"]
+    assert bench_haags.main(args) == 0
+    assert "baseline" in capsys.readouterr().out
+
+
+# Timings are unreliable on a busy machine, so these tests only run when
+# HAAGS_PERF_TESTS is set.
+perf_test = pytest.mark.skipif(
+    not os.environ.get("HAAGS_PERF_TESTS"), reason="HAAGS_PERF_TESTS is not set"
+)
+
+# Stages checked for linear scaling: a function that prepares the input
+# from text (untimed), and the function to time.
+Stage = Tuple[typing.Callable[[str], typing.Any], typing.Callable[[typing.Any], object]]
+SCALING_STAGES: typing.Dict[str, Stage] = {
+    "tokenize": (str, lambda s: list(haags.tokenize(s))),
+    "token_stream": (str, haags.TokenStream.from_text),
+    "apply_contractions": (
+        lambda s: list(haags.tokenize(s)),
+        haags.apply_contractions,
+    ),
+    "apply_single_words": (
+        lambda s: list(haags.tokenize(s)),
+        haags.apply_single_words,
+    ),
+    "translate": (str, haags.Translator(word_cache=haags.LRUCache(0)).translate),
+    "translate_document": (str, haags.translate_document),
+    "split_stream": (
+        lambda s: [s[i : i + 1000] for i in range(0, len(s), 1000)],
+        lambda chunks: list(haags.split_stream(chunks)),
+    ),
+}
+
+# Allowed growth beyond linear when the input grows 10×, and the time
+# below which measurements are too noisy to compare.
+SCALING_TOLERANCE = 3.0
+SCALING_MIN_SECONDS = 0.001
+
+
+@perf_test
+@pytest.mark.parametrize("stage", SCALING_STAGES)
+@pytest.mark.parametrize("corpus", ["prose", "contractions", "junk"])
+def test_scaling(stage: str, corpus: str) -> None:
+    import time
+
+    import bench_haags
+
+    prepare, fn = SCALING_STAGES[stage]
+    timings = []
+    for size in [500, 5000, 50000]:
+        data = prepare(bench_haags.generate(corpus, size))
+        best = float("inf")
+        for _ in range(3):
+            t0 = time.perf_counter()
+            fn(data)
+            best = min(best, time.perf_counter() - t0)
+        timings.append(best)
+    for small, large in zip(timings, timings[1:]):
+        bound = 10 * SCALING_TOLERANCE * max(small, SCALING_MIN_SECONDS)
+        assert large <= bound, f"{stage} grows faster than linear: {timings}"
+
+
+# Peak memory use per 1000 characters of input, in bytes, for a cold
+# translation. Words include the word cache entries they add.
+MEMORY_BUDGETS = {
+    "tokenize": 4000,
+    "contractions": 25000,
+    "words": 35000,
+    "assemble": 16000,
+}
+
+# Memory blocks per 1000 characters of input that each stage allocates
+# and still holds when it ends, for a cold translation.
+RETAINED_BLOCK_BUDGETS = {
+    "tokenize": 5,
+    "contractions": 750,
+    "words": 800,
+    "assemble": 5,
+}
+
+
+@pytest.mark.parametrize("corpus", ["prose", "contractions", "junk", "compounds"])
+def test_memory_budgets(corpus: str) -> None:
+    import bench_haags
+
+    haags.warmup()
+    text = bench_haags.generate(corpus, 20000)
+    expected = haags.translate(text)
+    translator = haags.Translator()
+    with haags.instrument(memory=True) as stats:
+        assert translator.translate(text) == expected
+    assert stats.calls == 1
+    for stage, budget in MEMORY_BUDGETS.items():
+        used = stats.peak_memory[stage] * 1000 / len(text)
+        assert 0 < used <= budget, f"{stage} uses {used:.0f} bytes per 1k chars"
+    for stage, budget in RETAINED_BLOCK_BUDGETS.items():
+        count = stats.retained_blocks[stage] * 1000 / len(text)
+        assert count <= budget, f"{stage} retains {count:.0f} blocks per 1k chars"
+
+
+def test_lazy_loading() -> None:
+    for module in ["pyphen", "sqlite3", "multiprocessing", "concurrent.futures"]:
+        code = f"import sys, haags; assert {module!r} not in sys.modules"
+        subprocess.run([sys.executable, "-c", code], check=True)
+    haags.warmup()
+    assert haags.hyphenation_dictionary is haags.get_hyphenation_dictionary()
+
+
+def test_hyphenation_cache(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    path = str(tmp_path / "hyphenation.sqlite")
+    haags.set_hyphenation_cache(path)
+    try:
+        haags.word_cache.clear()
+        expected = haags.translate("lekker kijken, politie")
+        assert haags.hyphenation_cache is not None
+        haags.hyphenation_cache.flush()
+
+        cache = haags.HyphenationCache(path)
+        assert cache.get("lekker") == [3]
+        assert cache.get("kijken") == [3]
+        assert cache.get("onbekend") is None
+        cache.close()
+
+        haags.word_cache.clear()
+        assert haags.translate("lekker kijken, politie") == expected
+
+        monkeypatch.setattr(
+            haags, "hyphenation_dictionary_version", lambda: "something else"
+        )
+        cache = haags.HyphenationCache(path)
+        assert cache.get("lekker") is None
+        cache.close()
+    finally:
+        haags.set_hyphenation_cache(None)
+        haags.word_cache.clear()
+
+
+def test_hyphenator() -> None:
+    pyphen = pytest.importorskip("pyphen")
+    reference = pyphen.Pyphen(lang="nl", left=1, right=1)
+    hyphenator = haags.get_hyphenation_dictionary()
+
+    # Vocabulary of the samples, the letters of all hyphenation patterns,
+    # and made up compound words.
+    with open("samples.txt") as fp:
+        vocabulary = sorted(set(re.findall(r"[^\W\d_]+", fp.read().lower())))
+    patterns = sorted(hyphenator.read_patterns(haags.hyphenation_dictionary_path()))
+    words = vocabulary + [p.strip(".") for p in patterns]
+    rng = random.Random(42)
+    words += ["".join(rng.sample(vocabulary, 3)) for _ in range(2000)]
+
+    expected = [reference.positions(word) for word in words]
+    assert hyphenator.positions_many(words) == expected
+    assert hyphenator.positions("lettergrepen") == [3, 6, 9]
+
+
+def test_syllable_rules() -> None:
+    syl = haags.Syllable("kijk", 0, 4)
+    names = [rule.name for rule in haags.SYLLABLE_RULES.rules_for(syl)]
+    assert names == ["ei_ij"]
+    assert haags.translate_syllable(syl) == ("kèk", 1)
+
+    rules = haags.SyllableRuleSet()
+
+    @rules.rule(nuclei=["ij"])
+    def ij(syl: haags.Syllable, out: haags.SyllableParts) -> None:
+        out.nucleus = "ei"
+
+    @rules.rule(match=lambda syl: syl.coda == "k")
+    def k(syl: haags.Syllable, out: haags.SyllableParts) -> None:
+        out.coda = "g"
+
+    assert rules.translate(syl) == ("keig", 1)
+    assert rules.translate(haags.Syllable("pak", 0, 3)) == ("pag", 1)
+    assert rules.rules_for(haags.Syllable("de", 0, 2)) == ()
+
+
+def test_translator() -> None:
+    translator = haags.Translator()
+    assert translator.translate("Ken je hem?") == "Kejjenem?"
+
+    variant = translator.extended(
+        words={"fiets": "stalen ros"},
+        syllables={"lek": "lak"},
+        contractions={"ga je": "gajje"},
+    )
+    assert variant.translate("Ga je fietsen? Fiets, lekker") == (
+        "Gajje fietse? Stalen ros, lakkâh"
+    )
+    assert translator.translate("Ga je, fiets") == "Ga je, fiets"
+    assert "fiets" not in haags.WORDS
+
+    with pytest.raises(attr.exceptions.FrozenInstanceError):
+        translator.words = {}  # type: ignore[misc]
+    with pytest.raises(TypeError):
+        translator.words["fiets"] = "ros"  # type: ignore[index]
+
+
+def test_translate_document() -> None:
+    with open("samples.txt") as fp:
+        text = fp.read()
+    expected = haags.translate(text)
+    assert haags.translate_document(text) == expected
+    assert haags.translate_document(text, workers=2, batch_size=100) == expected
+
+    variant = haags.Translator().extended(words={"lekker": "lekkâh!"})
+    text = "Ken je hem? LEKKER lekker politie"
+    expected = "Kejjenem? LEKKÂH! lekkâh! paulisie"
+    assert variant.translate(text) == expected
+    assert variant.translate_document(text, workers=2, batch_size=1) == expected
+
+
+def test_lexicon(
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+    tmp_path: pathlib.Path,
+) -> None:
+    with open("samples.txt") as fp:
+        text = fp.read()
+    translator = haags.Translator()
+    words = translator.vocabulary(haags.TokenStream.from_text(text))
+    path = str(tmp_path / "haags.lexicon")
+    translator.compile_lexicon(words, path)
+
+    lexicon = haags.Lexicon(path)
+    assert len(lexicon) == len(words)
+    assert lexicon.version == haags.hyphenation_dictionary_version()
+    assert lexicon.get("actualisatie") == "aktuwalisasie"
+    assert lexicon.get("niet") == translator.translate_word("niet")
+    assert lexicon.get("not-a-word") is None
+    assert lexicon.get("") is None
+
+    with_lexicon = attr.evolve(translator, lexicon=lexicon)
+    assert with_lexicon.translate(text) == haags.translate(text)
+    copy = pickle.loads(pickle.dumps(lexicon))
+    assert copy.get("actualisatie") == "aktuwalisasie"
+    lexicon.close()
+    copy.close()
+
+    stale = str(tmp_path / "stale.lexicon")
+    haags.write_lexicon(stale, {"kijk": "kèk"}, version="pyphen=0.0")
+    with pytest.warns(UserWarning, match="other hyphenation patterns"):
+        haags.Lexicon(stale).close()
+
+    monkeypatch.setattr("sys.stdin", io.StringIO("politie\n"))
+    assert haags.main(["--build-lexicon", path]) == 0
+    assert capsys.readouterr().out == ""
+    assert len(haags.Lexicon(path)) == 1
+    monkeypatch.setattr("sys.stdin", io.StringIO("Ken je de politie?\n"))
+    assert haags.main(["--lexicon", path]) == 0
+    assert capsys.readouterr().out == "Kejje de paulisie?\n"
+
+
 with open("samples.txt") as fp:
     pairs = read_sample_file(fp)
 